@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+word2questions.js.py 基准测试
+- 生成 1k ~ 200k 题的合成 .docx 题库（混合单选/多选/判断、多种答案写法、多段题干、题型写在题干末尾）
+- 分阶段计时：读取 docx、逐行解析（其中 normalize_answers / flush_current 单独累计）、merge_bank（--append-to 的完整合并，含默认的查重）、write_js
+- 记录吞吐量（题/秒）与峰值内存（RSS），结果写成 JSON 基线
+- 与已保存的基线比较，超过阈值即判定为性能回退（退出码 1）；读取方式或 --long-stems 与基线不同时拒绝比较（退出码 2）
+
+示例：
+python bench_word2questions.py --save baseline.json
+python bench_word2questions.py --sizes 1000,10000 --compare baseline.json --threshold 0.2
+python bench_word2questions.py --long-stems --sizes 10000      # 长“材料题”题干
+
+--verify 参考脚本.py 不计时，而是把当前脚本与另一版本的 word2questions.js.py（如改动前从 git 取出的副本）
+逐题比较解析结果：合成题库逐个题量比较 parse_docx，再用随机拼接的行比较 parse_lines，有差异即退出码 1。
+改动解析主循环（行分类、题干拼接、答案规范化）前后都应跑一遍：
+git show HEAD:"template(模板)/word2questions.js.py" > ref.py
+python bench_word2questions.py --verify ref.py --sizes 1000,10000
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Any, List
+from xml.sax.saxutils import escape
+
+try:
+    import resource  # Windows 上没有，峰值内存记为 None
+except ImportError:
+    resource = None
+
+SCRIPT = Path(__file__).with_name("word2questions.js.py")
+DEFAULT_SIZES = "1000,10000,50000,200000"
+# 只比较这些指标；越大越差
+COMPARE_KEYS = ("read_s", "parse_s", "normalize_s", "flush_s", "merge_s", "write_s", "total_s", "peak_rss_mb")
+
+def load_converter(path: Path = SCRIPT, name: str = "word2questions"):
+    # 文件名带 .js，不能直接 import
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+# ---- 合成题库 ----
+ANSWER_STYLES = [
+    lambda ls: "、".join(ls),
+    lambda ls: "".join(ls),
+    lambda ls: ",".join(ls),
+    lambda ls: " ".join(ls),
+    lambda ls: "+".join(ls),
+]
+JUDGE_ANSWERS = ["对", "错", "正确", "错误", "√", "×", "T", "F", "True", "No"]
+NUM_SEPS = [".", "、", ")"]
+
+def make_paragraphs(n: int, seed: int = 1, long_stems: bool = False) -> List[str]:
+    rnd = random.Random(seed)
+    paras = ["模拟题库（由 bench_word2questions.py 生成）", ""]
+    for i in range(1, n + 1):
+        q_type = rnd.choice(["单选", "单选", "多选", "判断"])
+        sep = rnd.choice(NUM_SEPS)
+        stem = f"第{i}题：关于设备维护与安全生产的说法中，下列描述（ ）符合规范要求"
+        if rnd.random() < 0.3:
+            paras.append(f"{i}{sep}{stem}（{q_type}）")  # 题型写在题干末尾
+        else:
+            paras.append(f"{i}{sep}（{q_type}）{stem}")
+        # 多段题干；长题干模式下模拟“材料题”，每题带多段长材料
+        extra = rnd.randint(3, 8) if long_stems else (1 if rnd.random() < 0.2 else 0)
+        for k in range(extra):
+            length = rnd.randint(200, 600) if long_stems else 30
+            paras.append(f"材料{k + 1}：" + "某企业生产线运行数据如下，请结合材料分析。" * (length // 20))
+        if q_type == "判断":
+            paras.append("答案：" + rnd.choice(JUDGE_ANSWERS))
+        else:
+            n_opts = rnd.choice([4, 4, 4, 5])
+            labels = "ABCDE"[:n_opts]
+            for label in labels:
+                paras.append(f"{label}{rnd.choice(NUM_SEPS)} 选项{label}：第{i}题的备选说法")
+            k = 1 if q_type == "单选" else rnd.randint(2, n_opts)
+            paras.append("答案：" + rnd.choice(ANSWER_STYLES)(sorted(rnd.sample(labels, k))))
+        paras.append("")
+    return paras
+
+def write_docx(path: Path, paragraphs: List[str]):
+    """直接写最小可用的 docx（不依赖 python-docx，生成 20 万题也只需数秒）"""
+    body = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{escape(t)}</w:t></w:r></w:p>' if t else "<w:p/>"
+        for t in paragraphs
+    )
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{body}<w:sectPr/></w:body></w:document>')
+    content_types = ('<?xml version="1.0" encoding="UTF-8"?>'
+                     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                     '<Default Extension="xml" ContentType="application/xml"/>'
+                     '<Override PartName="/word/document.xml" '
+                     'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                     '</Types>')
+    rels = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/></Relationships>')
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        # 固定时间戳，同样参数生成的文件逐字节一致
+        for name, data in (("[Content_Types].xml", content_types), ("_rels/.rels", rels), ("word/document.xml", document)):
+            zf.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data, zipfile.ZIP_DEFLATED)
+
+# ---- 单个规模的测量（在子进程中运行，峰值内存互不干扰） ----
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def measure(docx_path: Path, stream: bool) -> Dict[str, Any]:
+    w2q = load_converter()
+    timers = {"normalize_s": 0.0, "flush_s": 0.0}
+
+    def timed(fn, key):
+        def wrapper(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                timers[key] += time.perf_counter() - t0
+        return wrapper
+
+    # parse_lines 通过模块全局名调用这两个函数，替换后即可单独计时
+    w2q.normalize_answers = timed(w2q.normalize_answers, "normalize_s")
+    w2q.flush_current = timed(w2q.flush_current, "flush_s")
+
+    t0 = time.perf_counter()
+    lines = list(w2q.iter_docx_lines(docx_path, stream=stream))
+    t1 = time.perf_counter()
+    q_list = w2q.parse_lines(lines)
+    t2 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        # 以一份同等规模的现有题库模拟 --append-to
+        existing = Path(tmp) / "existing.js"
+        w2q.write_js(existing, q_list)
+        # 与命令行 --append-to 相同的参数，不加 --dedupe 时查重策略为 report
+        merge_args = argparse.Namespace(append_to=str(existing), explanations=False, renumber_after_merge=False, start_number=1,
+                                        dedupe=None, dedupe_against=None)
+        t3 = time.perf_counter()
+        merged = w2q.merge_bank(merge_args, q_list, w2q.dedupe_policy(merge_args), {})[0]
+        t4 = time.perf_counter()
+        w2q.write_js(Path(tmp) / "out.js", merged)
+        t5 = time.perf_counter()
+
+    total = (t1 - t0) + (t2 - t1) + (t5 - t4)  # 一次普通转换：读取 + 解析 + 写出
+    return {
+        "questions": len(q_list),
+        "lines": len(lines),
+        "read_s": round(t1 - t0, 4),
+        "parse_s": round(t2 - t1, 4),
+        "normalize_s": round(timers["normalize_s"], 4),
+        "flush_s": round(timers["flush_s"], 4),
+        "merge_s": round(t4 - t3, 4),
+        "write_s": round(t5 - t4, 4),
+        "total_s": round(total, 4),
+        "questions_per_s": round(len(q_list) / total) if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_child(docx_path: Path, stream: bool) -> Dict[str, Any]:
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--child", str(docx_path)]
+    if stream:
+        cmd.append("--stream")
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+# ---- 与参考版本逐题比较（--verify） ----
+# 随机拼接的行片段：题号、题型标注、选项、答案写法、全角/半角空白与标点的各种组合
+FUZZ_PIECES = ["1.", "２、", "12)", "3 .", "(单选)", "（多选）", "（ 判断 ）", "A.", "b、", "C)", "Ｄ．", "答案：", "正确答案:",
+               "答案", "正确", "错误", "AB", "对", "x", "文字", " ", "\u3000", "\t", "\n", "\xa0", "材料", ")", "）", "(", "2023年",
+               "a", "题", "ABCD", "答", "正", "解析：", "【解析】"]
+
+def as_dicts(questions) -> List[Dict[str, Any]]:
+    # 较早的版本返回字典，之后返回 Question 对象
+    return [q.to_dict() if hasattr(q, "to_dict") else dict(q) for q in questions]
+
+def first_difference(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> str:
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return f"第 {i + 1} 题：参考 {json.dumps(x, ensure_ascii=False)}\n  当前 {json.dumps(y, ensure_ascii=False)}"
+    return f"题数不同：参考 {len(a)}，当前 {len(b)}"
+
+def verify(ref_path: Path, docx_paths: List[Path], stream: bool, fuzz_runs: int, seed: int) -> List[str]:
+    """当前脚本与参考脚本的解析结果逐题比较，返回差异说明"""
+    cur = load_converter()
+    ref = load_converter(ref_path, "word2questions_ref")
+    diffs = []
+    for path in docx_paths:
+        a = as_dicts(ref.parse_docx(path, stream=stream))
+        b = as_dicts(cur.parse_docx(path, stream=stream))
+        if a != b:
+            diffs.append(f"{path.name}：{first_difference(a, b)}")
+    rnd = random.Random(seed)
+    for _ in range(fuzz_runs):
+        lines = ["".join(rnd.choice(FUZZ_PIECES) for _ in range(rnd.randint(0, 6))).replace("\u3000", " ").strip()
+                 for _ in range(rnd.randint(0, 15))]
+        for respect in (False, True):
+            a = as_dicts(ref.parse_lines(list(lines), 1, respect))
+            b = as_dicts(cur.parse_lines(list(lines), 1, respect))
+            if a != b:
+                diffs.append(f"parse_lines({lines!r}, respect_word_number={respect})：{first_difference(a, b)}")
+    return diffs
+
+# ---- 基线比较 ----
+# 这些运行条件不同的结果不可比（如 python-docx 读取本来就比流式读取慢得多）
+MATCH_META = ("reader", "long_stems")
+
+def meta_mismatch(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    cur, base = current.get("meta", {}), baseline.get("meta", {})
+    return [f"{key}: 基线 {base.get(key)!r}，本次 {cur.get(key)!r}" for key in MATCH_META if cur.get(key) != base.get(key)]
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    for size, res in current["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for key in COMPARE_KEYS:
+            new, old = res.get(key), base.get(key)
+            if new is None or not old:
+                continue
+            # 太小的计时噪声大，低于 10ms 的阶段不判定
+            if key.endswith("_s") and max(new, old) < 0.01:
+                continue
+            ratio = new / old - 1
+            if ratio > threshold:
+                regressions.append(f"{size} 题 {key}: {old} -> {new}（+{ratio:.0%}）")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="word2questions.js.py 基准测试（合成题库）")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help=f"题量列表，逗号分隔（默认：{DEFAULT_SIZES}）")
+    ap.add_argument("--reader", choices=("stream", "docx"), default="stream", help="读取方式：stream=流式（默认），docx=python-docx")
+    ap.add_argument("--long-stems", action="store_true", help="生成带多段长材料的题干（测试长题干拼接）")
+    ap.add_argument("--repeat", type=int, default=1, help="每个题量重复运行次数，计时取最小值（默认：1）")
+    ap.add_argument("--seed", type=int, default=1, help="随机种子（默认：1）")
+    ap.add_argument("--work-dir", help="合成 docx 的存放目录（默认：临时目录，用完删除）")
+    ap.add_argument("--save", help="把结果保存为 JSON 基线")
+    ap.add_argument("--compare", help="与指定 JSON 基线比较")
+    ap.add_argument("--threshold", type=float, default=0.2, help="回退判定阈值（默认 0.2，即慢 20%%）")
+    ap.add_argument("--verify", metavar="参考脚本.py", help="不计时，与另一版本的 word2questions.js.py 逐题比较解析结果，有差异时退出码 1")
+    ap.add_argument("--fuzz-runs", type=int, default=5000, help="--verify 时随机行比较的次数（默认：5000）")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--stream", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(Path(args.child), args.stream)))
+        return
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    if args.verify:
+        with tempfile.TemporaryDirectory() as tmp:
+            work = Path(args.work_dir) if args.work_dir else Path(tmp)
+            work.mkdir(parents=True, exist_ok=True)
+            paths = []
+            for n in sizes:
+                path = work / f"bench_{n}{'_long' if args.long_stems else ''}.docx"
+                if not path.exists():
+                    write_docx(path, make_paragraphs(n, seed=args.seed, long_stems=args.long_stems))
+                paths.append(path)
+            diffs = verify(Path(args.verify), paths, args.reader == "stream", args.fuzz_runs, args.seed)
+        if diffs:
+            print(f"❌ 解析结果与 {args.verify} 不同（{len(diffs)} 处）：", file=sys.stderr)
+            for d in diffs[:10]:
+                print("  " + d, file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ 解析结果与 {args.verify} 一致（{len(paths)} 个合成题库，{args.fuzz_runs} 组随机行）")
+        return
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "reader": args.reader,
+            "long_stems": args.long_stems,
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    if args.compare:
+        # 先检查运行条件，不一致时不必跑完再报错
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        mismatch = meta_mismatch(report, baseline)
+        if mismatch:
+            print("❌ 运行条件与基线不同，无法比较（请使用相同的 --reader / --long-stems）：", file=sys.stderr)
+            for m in mismatch:
+                print("  " + m, file=sys.stderr)
+            sys.exit(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(args.work_dir) if args.work_dir else Path(tmp)
+        work.mkdir(parents=True, exist_ok=True)
+        print(f"{'题量':>8} {'读取':>8} {'解析':>8} {'答案规范':>8} {'flush':>8} {'合并':>8} {'写出':>8} {'题/秒':>9} {'峰值MB':>8}")
+        for n in sizes:
+            docx_path = work / f"bench_{n}{'_long' if args.long_stems else ''}.docx"
+            if not docx_path.exists():
+                write_docx(docx_path, make_paragraphs(n, seed=args.seed, long_stems=args.long_stems))
+            # 多次运行时各计时取最小值，降低噪声
+            runs = [run_child(docx_path, args.reader == "stream") for _ in range(max(args.repeat, 1))]
+            res = dict(runs[0])
+            for key in COMPARE_KEYS:
+                if key.endswith("_s"):
+                    res[key] = min(r[key] for r in runs)
+            res["questions_per_s"] = round(res["questions"] / res["total_s"]) if res["total_s"] else None
+            report["results"][str(n)] = res
+            print(f"{n:>8} {res['read_s']:>8.3f} {res['parse_s']:>8.3f} {res['normalize_s']:>8.3f} {res['flush_s']:>8.3f} "
+                  f"{res['merge_s']:>8.3f} {res['write_s']:>8.3f} {res['questions_per_s'] or 0:>9} {res['peak_rss_mb'] or '-':>8}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"✅ 已保存基线：{args.save}")
+
+    if args.compare:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"❌ 性能回退（阈值 {args.threshold:.0%}）：", file=sys.stderr)
+            for r in regressions:
+                print("  " + r, file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ 与基线相比无回退（阈值 {args.threshold:.0%}）")
+
+if __name__ == "__main__":
+    main()
@@ -26,19 +26,50 @@ D. 选项4
 
 依赖：python-docx
 pip install python-docx
+（--stream 流式模式直接读取 docx 内的 XML，不依赖 python-docx）
+
+作为库使用：from word2questions import iter_questions, write_bank（见 word2questions.py）
 """
 import argparse
+import copy
+import difflib
+import glob
+import gzip
+import hashlib
+import html
+import io
+import itertools
+import os
+import posixpath
+import random
+import time
+import tracemalloc
+import unicodedata
 import json
 import re
 import sys
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 try:
     from docx import Document  # python-docx
-except Exception as e:
-    print("缺少依赖 python-docx，请先安装：pip install python-docx", file=sys.stderr)
-    raise
+except Exception:
+    Document = None  # 仅流式模式可用；默认模式在读取时再提示安装
+
+try:
+    import brotli  # 可选：--precompress 生成 .br
+except Exception:
+    brotli = None
+
+np = None  # 可选：--near-dupes 的 MinHash 签名按矩阵计算；导入要 0.1 秒、十几 MB 内存，用到时才由 load_numpy() 导入
+
+# 解析规则（语法）版本：修改正则、规范化或输出结构后递增，使旧的转换缓存全部失效
+GRAMMAR_VERSION = "2"  # 2：段落前拼上 Word 自动编号
 
 # 正则模式
 RE_Q_START = re.compile(
@@ -52,23 +83,60 @@ RE_Q_START = re.compile(
 
 RE_Q_TYPE_AT_END = re.compile(r"(?P<body>.*?)[（(]\s*(单选|多选|判断)\s*[)）]\s*$")
 RE_OPT = re.compile(r"^\s*([A-Za-z])\s*[\.\、\)]\s*(.*\S)\s*$")
+# 只有字母和分隔符的选项行（“A.”），段落里带图片（--asset-dir）时是图片选项
+RE_OPT_BARE = re.compile(r"^\s*([A-Za-z])\s*[\.\、\)]\s*$")
 RE_ANS = re.compile(r"^\s*(?:答案|正确答案)\s*[:：]\s*(.+?)\s*$")
+# 解析（--explanations）：“解析：”“答案解析：”“【解析】”；必须带冒号或括号，避免把“解析几何……”之类的题干当成解析
+RE_EXPLAIN = re.compile(r"^(?:[【\[](?:答案|试题)?解析[】\]]|(?:答案|试题)?解析\s*[:：])\s*(.*)$")
+EXPLAIN_LEADS = frozenset("【[答试解")
 
 TRUE_SET = {"对", "正确", "√", "T", "TRUE", "YES", "Y", "是"}
 FALSE_SET = {"错", "错误", "×", "F", "FALSE", "NO", "N", "否"}
 
+# 行分类：按首字符分派，每行最多执行一次专用正则
+LINE_BLANK, LINE_Q_START, LINE_OPTION, LINE_ANSWER, LINE_TEXT = range(5)
+OPTION_LEADS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")
+ANSWER_LEADS = frozenset("答正")  # 答案 / 正确答案
+TYPE_AT_END_TAILS = frozenset(")）")
+
 def clean(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
+    # 与 re.sub(r"\s+", " ", s).strip() 等价（\s 与 str.split() 使用同一套 Unicode 空白定义）
+    return " ".join(s.split()) if s else ""
+
+def classify_line(line: str):
+    """
+    对已去首尾空白的一行分类，返回 (行类型, match)。
+    先看首字符：数字才尝试题起始、ASCII 字母才尝试选项、“答/正”才尝试答案，其余一律为普通文本。
+    """
+    if not line:
+        return LINE_BLANK, None
+    c = line[0]
+    if c.isdecimal():  # 与正则 \d 一致（含全角数字）
+        m = RE_Q_START.match(line)
+        if m:
+            return LINE_Q_START, m
+    elif c in OPTION_LEADS:
+        m = RE_OPT.match(line)
+        if m:
+            return LINE_OPTION, m
+    elif c in ANSWER_LEADS:
+        m = RE_ANS.match(line)
+        if m:
+            return LINE_ANSWER, m
+    return LINE_TEXT, None
 
 def extract_type_from_text(text: str) -> (str, str):
     """
     如果题型写在题干末尾 (……(单选))，从末尾提取题型并返回 (type, body_without_type)
     否则返回 (None, 原文)
     """
-    m = RE_Q_TYPE_AT_END.match(text)
-    if m:
-        body, typ = m.group("body"), m.group(2)
-        return typ, clean(body)
+    # 题型标注必然以右括号结尾（允许尾随空白），不是的话不必跑正则
+    tail = text.rstrip()[-1:]
+    if tail in TYPE_AT_END_TAILS:
+        m = RE_Q_TYPE_AT_END.match(text)
+        if m:
+            body, typ = m.group("body"), m.group(2)
+            return typ, clean(body)
     return None, clean(text)
 
 def normalize_answers(ans_text: str, q_type: str) -> List[str]:
@@ -105,74 +173,1278 @@ def normalize_answers(ans_text: str, q_type: str) -> List[str]:
                 uniq.append(ch)
         return uniq
 
-def flush_current(q_list: List[Dict[str, Any]], buf: Dict[str, Any]):
-    if not buf:
+# ---- 文末答案表（--answer-key） ----
+# 有的文档不在每题后写“答案：”，而是在文末（或每章末）集中列出答案：
+#   参考答案
+#   1-5 CABDA   6-10 √×√√×
+#   11.AB 12.C 13、正确
+# 或者是表格（横排：一行题号、一行答案；竖排：每行“题号 | 答案”，可多对并排）。
+# 答案表模式下题目先挂起，答案表结束（下一题开始或文档结束）时按 Word 题号补上缺少的答案再产出。
+RE_KEY_HEAD = re.compile(r"^(?:[一二三四五六七八九十]+\s*[、.．]\s*)?(?:参考)?答案(?:与解析|及解析|速查|汇总)?\s*[:：]?$")
+RE_KEY_RANGE_LEAD = re.compile(r"^\d+\s*[-－~～—–]+\s*\d+")
+KEY_MARKS = "A-Za-z√×✓✗对错"
+RE_KEY_ENTRY = re.compile(
+    rf"""(?P<first>\d+)\s*[-－~～—–]+\s*(?P<last>\d+)\s*[:：.．、]?\s*(?P<seq>[{KEY_MARKS}](?:\s?[{KEY_MARKS}])*)  # 1-5 CABDA
+        |(?P<num>\d+)\s*[.．、:：)）]?\s*(?P<ans>正确|错误|[A-Za-z]+|[√×✓✗对错])                        # 11.AB""",
+    re.X,
+)
+RE_KEY_ANSWER = re.compile(r"^(?:正确|错误|[A-Za-z]+|[√×✓✗对错])$")
+RE_KEY_SEP = re.compile(r"[\s,，;；]*")
+KEY_NOTE_NUMBERS = 10  # 摘要里最多列出的题号个数
+
+class TableRow(str):
+    """表格的一行：字符串值为各单元格以制表符相连，cells 为各单元格文本（只有答案表模式才读取表格）"""
+
+    def __new__(cls, cells: List[str]):
+        row = super().__new__(cls, "\t".join(cells))
+        row.cells = cells
+        return row
+
+def parse_key_line(line: str) -> Optional[List[Tuple[int, str]]]:
+    """整行都是答案表条目时返回 [(题号, 答案)]，否则返回 None；区间条目的答案个数必须与题数一致"""
+    line = unicodedata.normalize("NFKC", line)  # 全角字母、数字
+    entries: List[Tuple[int, str]] = []
+    pos = RE_KEY_SEP.match(line).end()
+    while pos < len(line):
+        m = RE_KEY_ENTRY.match(line, pos)
+        if not m:
+            return None
+        if m.group("seq"):
+            first, last = int(m.group("first")), int(m.group("last"))
+            marks = m.group("seq").replace(" ", "")
+            if last - first + 1 != len(marks):
+                return None
+            entries.extend(zip(range(first, last + 1), marks))
+        else:
+            entries.append((int(m.group("num")), m.group("ans")))
+        pos = RE_KEY_SEP.match(line, m.end()).end()
+    return entries or None
+
+def parse_key_row(cells: List[str], state: Dict[str, Any]) -> List[Tuple[int, str]]:
+    """
+    答案表格的一行，返回 [(题号, 答案)]（不是答案行时为空）。
+    只有题号（可带“题号”之类的表头格）的行记入 state，供下一行按列对齐；
+    否则依次尝试“题号 | 答案”成对并排，以及每格一条文本条目（如“1-5 CABDA”）。
+    """
+    cells = [clean(c) for c in cells]
+    header = state.pop("header", None)
+    if header is not None and len(header) == len(cells):
+        entries = [(n, c) for n, c in zip(header, cells) if n is not None and RE_KEY_ANSWER.match(c)]
+        if entries:
+            return entries
+    nums = [int(c) if c.isdecimal() else None for c in cells]
+    labels = [c for c, n in zip(cells, nums) if n is None and c]
+    if any(n is not None for n in nums) and len(labels) <= 1 and not any(RE_KEY_ANSWER.match(c) for c in labels):
+        state["header"] = nums
+        return []
+    filled = [c for c in cells if c]
+    if len(filled) % 2 == 0 and all(filled[i].isdecimal() and RE_KEY_ANSWER.match(filled[i + 1]) for i in range(0, len(filled), 2)):
+        return [(int(filled[i]), filled[i + 1]) for i in range(0, len(filled), 2)]
+    entries = []
+    for c in filled:
+        parsed = parse_key_line(c)
+        if parsed is None:
+            return []
+        entries.extend(parsed)
+    return entries
+
+def key_answer(text: str, q_type: str) -> Tuple[str, ...]:
+    """答案表里的答案：连写的字母（如 ACD）拆开后再按题型规范化"""
+    if q_type != "判断" and text.isascii():
+        text = "、".join(text)
+    return tuple(normalize_answers(text, q_type))
+
+def key_report_note(report: Dict[str, List[Any]]) -> str:
+    def numbers(ns: List[Any]) -> str:
+        shown = "、".join(map(str, ns[:KEY_NOTE_NUMBERS]))
+        return shown + ("…" if len(ns) > KEY_NOTE_NUMBERS else "")
+
+    notes = []
+    if report.get("unanswered"):
+        notes.append(f"{len(report['unanswered'])} 题在答案表中找不到答案（题号 {numbers(report['unanswered'])}）")
+    if report.get("unused"):
+        notes.append(f"答案表中 {len(report['unused'])} 个题号没有对应的题（{numbers(report['unused'])}）")
+    if report.get("bad_lines"):
+        notes.append(f"答案表中 {len(report['bad_lines'])} 行无法识别（{numbers(report['bad_lines'])}）")
+    return "；".join(notes)
+
+# ---- 题目记录 ----
+class Question:
+    """
+    解析得到的一道题。大题库转换时题目对象数以十万计，这里用 __slots__ 代替字典：
+    选项存为 (标签, 文本) 元组、答案存为元组、题型字符串驻留，只在序列化时经 to_dict() 生成字典。
+    提供 get / [] 访问，写出函数可以与从现有题库读回的字典（--append-to）混用。
+    """
+    __slots__ = ("options", "answer", "type", "question", "number", "images", "explanation", "option_images")
+
+    def __init__(self, type: str = "单选", question: str = "", number: int = 0, options=(), answer=(), images=(), explanation: str = "",
+                 option_images: Optional[Dict[str, Tuple[str, ...]]] = None):
+        # 字段顺序与 to_dict() 输出顺序一致
+        self.options = options
+        self.answer = answer
+        self.type = sys.intern(type)
+        self.question = question
+        self.number = number
+        self.images = images  # 图片引用路径（--asset-dir），没有图片的题不输出该字段
+        self.explanation = explanation  # 解析（--explanations），写出题库时拆到单独的解析文件
+        self.option_images = option_images  # 选项标签 -> 该选项段落里的图片（图片选项），输出为选项的 images 字段
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "options":
+            return self.option_dicts()
+        if key in self.__slots__:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Question):
+            return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Question({self.to_dict()!r})"
+
+    def option_dicts(self) -> List[Dict[str, Any]]:
+        """选项字典列表；带图片的选项多一个 images 字段"""
+        if not self.option_images:
+            return [{"label": label, "text": text} for label, text in self.options]
+        out = []
+        for label, text in self.options:
+            d = {"label": label, "text": text}
+            if label in self.option_images:
+                d["images"] = list(self.option_images[label])
+            out.append(d)
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        """输出用字典，键顺序保持原输出格式：options, answer, type, question, number（有图片、解析时再加 images、explanation）"""
+        d = {
+            "options": self.option_dicts(),
+            "answer": list(self.answer),
+            "type": self.type,
+            "question": self.question,
+            "number": self.number,
+        }
+        if self.images:
+            d["images"] = list(self.images)
+        if self.explanation:
+            d["explanation"] = self.explanation
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Question":
+        """从缓存读回的字典还原（缓存内容由 to_dict 写出，不含其他字段）"""
+        return cls(
+            type=d.get("type", "单选"),
+            question=d.get("question", ""),
+            number=d.get("number", 0),
+            options=tuple((o.get("label", ""), o.get("text", "")) for o in d.get("options", [])),
+            answer=tuple(d.get("answer", [])),
+            images=tuple(d.get("images", ())),
+            explanation=d.get("explanation", ""),
+            option_images={o["label"]: tuple(o["images"]) for o in d.get("options", []) if o.get("images")} or None,
+        )
+
+def question_json(obj: Any) -> Dict[str, Any]:
+    """json.dumps 的 default 钩子：遇到 Question 时才转成字典"""
+    if isinstance(obj, Question):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def questions_from_json(items: Optional[List[Any]]) -> Optional[List[Question]]:
+    if items is None:
+        return None
+    return [Question.from_dict(d) for d in items]
+
+def option_pairs(q: Any) -> List[Tuple[str, str]]:
+    """(标签, 文本) 列表；Question 直接取元组，字典题目逐项转换"""
+    if isinstance(q, Question):
+        return list(q.options)
+    return [(o.get("label", ""), o.get("text", "")) for o in q.get("options", [])]
+
+def option_images(q: Any) -> Dict[str, List[str]]:
+    """选项标签 -> 图片引用（只含带图片的选项）"""
+    if isinstance(q, Question):
+        return dict(q.option_images or {})
+    return {o.get("label", ""): o["images"] for o in q.get("options", []) if o.get("images")}
+
+def add_images(images: Tuple[str, ...], new: Tuple[str, ...]) -> Tuple[str, ...]:
+    """追加图片引用并去重（同一张图在多个段落里出现时只记一次）"""
+    return tuple(dict.fromkeys(images + tuple(new)))
+
+JUDGE_OPTIONS = (("A", "正确"), ("B", "错误"))
+
+def flush_current(q_list: List[Question], buf: Optional[Question]):
+    if buf is None:
         return
     # 判断题如果用户没有给选项，自动补 “正确/错误”
-    if buf.get("type") == "判断" and not buf.get("options"):
-        buf["options"] = [
-            {"label": "A", "text": "正确"},
-            {"label": "B", "text": "错误"},
-        ]
-    # 选项去重/清洗
+    if buf.type == "判断" and not buf.options:
+        buf.options = JUDGE_OPTIONS
+    # 选项去重/清洗；只有图片没有文字的选项保留
     seen = set()
     cleaned_opts = []
-    for opt in buf.get("options", []):
-        label = opt.get("label", "").upper()
-        text = clean(opt.get("text", ""))
-        if not label or not text or label in seen:
+    pictured = buf.option_images or {}
+    for label, text in buf.options:
+        label = label.upper()
+        text = clean(text)
+        if not label or not (text or label in pictured) or label in seen:
             continue
         seen.add(label)
-        cleaned_opts.append({"label": label, "text": text})
-    buf["options"] = cleaned_opts
+        cleaned_opts.append((label, text))
+    buf.options = tuple(cleaned_opts)
+    if pictured:
+        buf.option_images = {label: pictured[label] for label in seen if label in pictured} or None
 
-    # 答案规范为列表（可能为空）
-    ans = buf.get("answer", [])
+    # 答案规范为元组（可能为空）
+    ans = buf.answer
     if isinstance(ans, str):
-        ans = [ans] if ans else []
-    buf["answer"] = ans
+        ans = (ans,) if ans else ()
+    buf.answer = tuple(ans)
 
     # 最终检查：题干必须存在
-    if clean(buf.get("question", "")):
-        q_list.append(buf.copy())
-
-def parse_docx(docx_path: Path, start_number: int = 1, respect_word_number: bool = False) -> List[Dict[str, Any]]:
-    doc = Document(str(docx_path))
-    lines: List[str] = []
-    for p in doc.paragraphs:
-        t = p.text.replace("\u3000", " ").strip()  # 去全角空格
-        if t:
-            lines.append(t)
+    if clean(buf.question):
+        q_list.append(buf)
+
+# ---- 分阶段统计（--profile / --stats-json） ----
+class ConvertStats:
+    """
+    记录一次转换各阶段的耗时、tracemalloc 内存峰值与计数。
+    只在 --profile / --stats-json 时创建；解析函数收到 None 时不做任何统计。
+    """
+
+    def __init__(self):
+        self.times: Dict[str, float] = {}
+        self.peaks: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add_time(self, name: str, seconds: float):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        """计时一个顶层阶段，并记录该阶段内的内存峰值（需先 tracemalloc.start()）"""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+            if tracing:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+
+    def timed_iter(self, it, name: str):
+        """统计从迭代器取数据的耗时（流式读取与解析交错进行，只能按取行计时）"""
+        it = iter(it)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - t0)
+                return
+            self.add_time(name, time.perf_counter() - t0)
+            self.count("lines")
+            yield item
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "times_s": {k: round(v, 6) for k, v in self.times.items()},
+            "peak_mb": {k: round(v / (1024 * 1024), 3) for k, v in self.peaks.items()},
+            "counts": dict(self.counts),
+        }
+
+    def merge(self, other: Dict[str, Any]):
+        """汇总（批量模式）另一份 to_dict() 结果"""
+        for k, v in other.get("times_s", {}).items():
+            self.add_time(k, v)
+        for k, v in other.get("peak_mb", {}).items():
+            self.peaks[k] = max(self.peaks.get(k, 0), int(v * 1024 * 1024))
+        for k, v in other.get("counts", {}).items():
+            self.count(k, v)
+
+STAGE_LABELS = {
+    "parse": "解析（合计）",
+    "load": "  读取 docx",
+    "classify": "  行分类/题干拼接",
+    "normalize": "  答案规范化",
+    "merge": "合并现有题库",
+    "serialize": "序列化写出",
+}
+COUNT_LABELS = {
+    "lines": "段落行数",
+    "line_q_start": "题起始行",
+    "line_option": "选项行",
+    "line_answer": "答案行",
+    "line_text": "题干续行",
+    "line_blank": "空行",
+    "line_ignored": "首题前被忽略的行",
+    "line_key": "答案表行",
+    "answer_from_format": "答案取自选项格式",
+    "line_explain": "解析行",
+    "type_at_end": "题型写在题干末尾",
+    "questions": "输出题数",
+    "dropped_empty_stem": "题干为空被丢弃",
+}
+
+def print_profile(stats: ConvertStats, file=sys.stderr):
+    print("⏱ 分阶段统计：", file=file)
+    for name in STAGE_LABELS:
+        if name in stats.times:
+            peak = f"  峰值 {stats.peaks[name] / (1024 * 1024):.1f} MB" if name in stats.peaks else ""
+            print(f"  {STAGE_LABELS[name]:<12} {stats.times[name]:>9.4f}s{peak}", file=file)
+    for name, label in COUNT_LABELS.items():
+        if name in stats.counts:
+            print(f"  {label:<12} {stats.counts[name]:>9}", file=file)
+
+# ---- 流式读取 word/document.xml ----
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY = W_NS + "body"
+W_P = W_NS + "p"
+W_R = W_NS + "r"
+W_HYPERLINK = W_NS + "hyperlink"
+W_T = W_NS + "t"
+W_BR = W_NS + "br"
+W_TYPE = W_NS + "type"
+W_TBL = W_NS + "tbl"
+W_TR = W_NS + "tr"
+W_TC = W_NS + "tc"
+# 与 python-docx 的 Run.text 保持一致的内联元素 -> 文本映射（w:br 另行按类型处理）
+RUN_INLINE_TEXT = {
+    W_NS + "tab": "\t",
+    W_NS + "ptab": "\t",
+    W_NS + "cr": "\n",
+    W_NS + "noBreakHyphen": "-",
+}
+
+class DocLine(str):
+    """带附加信息的段落文本：marked 为选项带格式标记（--answer-format），images 为段落内图片的引用路径（--asset-dir）"""
+
+    def __new__(cls, text: str, marked: bool = False, images: Tuple[str, ...] = ()):
+        line = super().__new__(cls, text)
+        line.marked = marked
+        line.images = images
+        return line
+
+def run_text(r: ET.Element) -> str:
+    parts = []
+    for e in r:
+        tag = e.tag
+        if tag == W_T:
+            parts.append(e.text or "")
+        elif tag == W_BR:
+            # 仅“换行”型 br 产生换行；分页/分栏符为空串
+            if e.get(W_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
         else:
-            lines.append("")  # 保留空行分段
+            parts.append(RUN_INLINE_TEXT.get(tag, ""))
+    return "".join(parts)
+
+def paragraph_text(p: ET.Element, math: bool = False) -> str:
+    """
+    段落文本：与 python-docx 的 Paragraph.text 相同，只取 w:r 与 w:hyperlink 下的 w:r；
+    math 为真时公式（m:oMath / m:oMathPara）按所在位置转成 MathML（见 math_markup）。
+    """
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(run_text(r) for r in child.iter(W_R))
+        elif math and (child.tag == M_OMATH or child.tag == M_OMATH_PARA):
+            parts.append(math_markup(child))
+    return "".join(parts)
+
+def tag_line(text: str, p, formats: Optional["FormatMarks"], assets: Optional["ImageAssets"]) -> str:
+    """段落文本附上格式标记与图片引用，两者都没有时原样返回"""
+    marked = formats is not None and formats.marked(p, text)
+    images = assets.paragraph_images(p) if assets is not None else ()
+    return DocLine(text, marked, images) if marked or images else text
+
+def table_rows(tbl: ET.Element) -> Iterator[TableRow]:
+    for tr in tbl.findall(W_TR):
+        yield TableRow(["\n".join(paragraph_text(p) for p in tc.iter(W_P)) for tc in tr.findall(W_TC)])
+
+def iter_docx_paragraphs(docx_path, tables: bool = False, numbering: bool = True, answer_format: str = "",
+                         asset_dir: Optional[Path] = None, asset_url: str = "", math: bool = False) -> Iterator[str]:
+    """
+    增量解析 docx 中的 word/document.xml，逐段产出正文段落文本。
+    - 不构建 python-docx 对象树；
+    - 只取 body 下的直接段落（与 Document.paragraphs 一致，表格内段落不计）；tables 为真时表格按行产出 TableRow；
+    - numbering 为真时在段落前拼上 Word 自动编号（见 ListNumbering）；
+    - answer_format 不为空时，选项文字带对应格式的段落以 DocLine 产出（见 FormatMarks）；
+    - asset_dir 不为空时，段落内的图片写入素材目录，引用路径（asset_url + 文件名）附在 DocLine.images 上（见 ImageAssets）；
+    - math 为真时段落里的 Word 公式转成 MathML 拼进文本；
+    - 每处理完 body 的一个子元素即清空，峰值内存与文档长度无关。
+    """
+    with zipfile.ZipFile(docx_path) as zf, zf.open("word/document.xml") as fh:
+        lists = ListNumbering.from_zip(zf) if numbering else None
+        mask = format_mask(answer_format)
+        formats = FormatMarks.from_zip(zf, mask) if mask else None
+        assets = ImageAssets.from_zip(zf, asset_dir, asset_url) if asset_dir is not None else None
+        stack: List[ET.Element] = []
+        body = None
+        for event, elem in ET.iterparse(fh, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                if elem.tag == W_BODY:
+                    body = elem
+                continue
+            stack.pop()
+            if body is None or not stack or stack[-1] is not body:
+                continue
+            if elem.tag == W_P:
+                text = paragraph_text(elem, math)
+                if lists is not None:
+                    label = lists.label(elem)
+                    if label and text.strip():
+                        text = label + text
+                yield tag_line(text, elem, formats, assets)
+            elif tables and elem.tag == W_TBL:
+                yield from table_rows(elem)
+            # body 的子元素已消费完毕，丢弃（此时 body 下只剩这一个子元素）
+            body.clear()
+
+def iter_document_blocks(doc, tables: bool = False, numbering: bool = True, answer_format: str = "",
+                         asset_dir: Optional[Path] = None, asset_url: str = "", math: bool = False) -> Iterator[str]:
+    """
+    python-docx 文档按正文顺序产出段落文本（numbering 为真时拼上自动编号），tables 为真时也产出表格行（TableRow），
+    带格式标记的选项段落、带图片的段落以 DocLine 产出（参数同 iter_docx_paragraphs）。
+    """
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    lists = ListNumbering.from_document(doc) if numbering else None
+    mask = format_mask(answer_format)
+    formats = FormatMarks.from_document(doc, mask) if mask else None
+    assets = ImageAssets.from_document(doc, asset_dir, asset_url) if asset_dir is not None else None
+    for child in doc.element.body.iterchildren():
+        if child.tag == W_P:
+            # Paragraph.text 不含公式，公式模式改用与流式读取相同的取文本方式
+            text = paragraph_text(child, True) if math else Paragraph(child, doc).text
+            if lists is not None:
+                label = lists.label(child)
+                if label and text.strip():
+                    text = label + text
+            yield tag_line(text, child, formats, assets)
+        elif tables and child.tag == W_TBL:
+            for row in Table(child, doc).rows:
+                yield TableRow([cell.text for cell in row.cells])
+
+def iter_docx_lines(docx_path, stream: bool = False, tables: bool = False, numbering: bool = True, answer_format: str = "",
+                    asset_dir: Optional[Path] = None, asset_url: str = "", math: bool = False) -> Iterator[str]:
+    """
+    docx_path 可以是路径，也可以是已打开的二进制文件对象（如上传的文件流）；
+    tables 为真时同时产出表格行（答案表模式）；numbering 为真时段落前拼上 Word 自动编号（题号、选项字母）；
+    answer_format 为“bold,color,highlight”的子集或“any”，带这些格式的选项段落产出为 DocLine；
+    asset_dir 不为空时提取段落内的图片（见 ImageAssets），asset_url 为题目里引用图片的路径前缀；
+    math 为真时 Word 公式转成 MathML 留在段落文本里。
+    """
+    extra = {"answer_format": answer_format, "asset_dir": asset_dir, "asset_url": asset_url, "math": math}
+    if stream:
+        paragraphs = iter_docx_paragraphs(docx_path, tables=tables, numbering=numbering, **extra)
+    else:
+        if Document is None:
+            raise RuntimeError("缺少依赖 python-docx，请先安装：pip install python-docx（或使用 --stream 模式）")
+        doc = Document(docx_path if hasattr(docx_path, "read") else str(docx_path))
+        paragraphs = iter_document_blocks(doc, tables=tables, numbering=numbering, **extra)
+    for text in paragraphs:
+        if isinstance(text, TableRow):
+            yield TableRow([c.replace("\u3000", " ").strip() for c in text.cells])
+            continue
+        if isinstance(text, DocLine):
+            yield DocLine(text.replace("\u3000", " ").strip(), text.marked, text.images)
+            continue
+        # 去全角空格；空段落保留为空行用于分段
+        # 全角标点已由各正则的字符类兼容，这里只需替换全角空格；str.replace 比 translate 快两个数量级
+        yield text.replace("\u3000", " ").strip()
+
+# ---- Word 自动编号（word/numbering.xml） ----
+# 题号和选项字母用 Word 的自动编号时，段落文本里没有它们（p.text 只有正文），RE_Q_START / RE_OPT 都匹配不上。
+# 这里按 numbering.xml 的列表定义和计数器算出每段实际显示的编号文本，拼回段落开头。
+# 编号定义在打开文档时一次解析好（每级的起始值、格式、编号模板），计数器按列表保存，每段只需 O(1) 查表与格式化。
+W_PPR = W_NS + "pPr"
+W_PSTYLE = W_NS + "pStyle"
+W_NUMPR = W_NS + "numPr"
+W_NUMID = W_NS + "numId"
+W_ILVL = W_NS + "ilvl"
+W_VAL = W_NS + "val"
+W_ABSTRACT_NUM = W_NS + "abstractNum"
+W_ABSTRACT_NUM_ID = W_NS + "abstractNumId"
+W_NUM = W_NS + "num"
+W_LVL = W_NS + "lvl"
+W_LVL_OVERRIDE = W_NS + "lvlOverride"
+W_START_OVERRIDE = W_NS + "startOverride"
+W_START = W_NS + "start"
+W_NUM_FMT = W_NS + "numFmt"
+W_LVL_TEXT = W_NS + "lvlText"
+W_LVL_RESTART = W_NS + "lvlRestart"
+W_SUFF = W_NS + "suff"
+W_STYLE = W_NS + "style"
+W_STYLE_ID = W_NS + "styleId"
+W_BASED_ON = W_NS + "basedOn"
+LIST_LEVELS = 9
+RE_LVL_TEXT = re.compile(r"%([1-9])")
+CHINESE_DIGITS = "零一二三四五六七八九"
+CHINESE_LEGAL_DIGITS = "零壹贰叁肆伍陆柒捌玖"
+IDEOGRAPH_TRADITIONAL = "甲乙丙丁戊己庚辛壬癸"
+IDEOGRAPH_ZODIAC = "子丑寅卯辰巳午未申酉戌亥"
+ROMAN_NUMERALS = ((1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                  (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I"))
+FULLWIDTH_DIGITS = str.maketrans("0123456789", "０１２３４５６７８９")
+NO_LABEL_FORMATS = frozenset(("bullet", "none"))  # 项目符号不是题号/选项，不拼到正文前
+
+def chinese_number(n: int, digits: str = CHINESE_DIGITS, ten: str = "十") -> str:
+    if 0 <= n < 10:
+        return digits[n]
+    if n < 100:
+        tens, ones = divmod(n, 10)
+        return (digits[tens] if tens > 1 else "") + ten + (digits[ones] if ones else "")
+    return str(n)
+
+def roman_number(n: int) -> str:
+    parts = []
+    for value, numeral in ROMAN_NUMERALS:
+        count, n = divmod(n, value)
+        parts.append(numeral * count)
+    return "".join(parts)
+
+def format_list_number(n: int, fmt: str) -> str:
+    """按 w:numFmt 格式化编号；不认识的格式按十进制"""
+    if fmt == "upperLetter" or fmt == "lowerLetter":
+        # Word 超过 Z 之后为 AA、BB……
+        s = chr(ord("A") + (n - 1) % 26) * ((n - 1) // 26 + 1) if n > 0 else str(n)
+        return s if fmt == "upperLetter" else s.lower()
+    if fmt == "upperRoman" or fmt == "lowerRoman":
+        s = roman_number(n) if n > 0 else str(n)
+        return s if fmt == "upperRoman" else s.lower()
+    if fmt == "decimalZero":
+        return f"{n:02d}"
+    if fmt in ("decimalEnclosedCircle", "decimalEnclosedCircleChinese"):
+        return chr(0x2460 + n - 1) if 1 <= n <= 20 else str(n)
+    if fmt in ("decimalFullWidth", "decimalFullWidth2"):
+        return str(n).translate(FULLWIDTH_DIGITS)
+    if fmt in ("chineseCounting", "chineseCountingThousand", "taiwaneseCounting", "taiwaneseCountingThousand"):
+        return chinese_number(n)
+    if fmt == "chineseLegalSimplified":
+        return chinese_number(n, CHINESE_LEGAL_DIGITS, "拾")
+    if fmt == "ideographTraditional":
+        return IDEOGRAPH_TRADITIONAL[(n - 1) % 10] if n > 0 else str(n)
+    if fmt == "ideographZodiac":
+        return IDEOGRAPH_ZODIAC[(n - 1) % 12] if n > 0 else str(n)
+    return str(n)
+
+class ListLevel:
+    """一级编号的定义：起始值、格式、编号模板（文字与 %N 引用的级别下标交替）、编号后缀、何时重新开始"""
+    __slots__ = ("start", "fmt", "parts", "suffix", "restart")
+
+    def __init__(self, lvl):
+        def val(tag: str, default: Optional[str] = None) -> Optional[str]:
+            e = lvl.find(tag)
+            return e.get(W_VAL, default) if e is not None else default
+
+        self.start = int(val(W_START, "1"))
+        self.fmt = val(W_NUM_FMT, "decimal")
+        parts = RE_LVL_TEXT.split(val(W_LVL_TEXT, "") or "")
+        # split 结果中奇数位置是级别号（1 起），转成下标
+        self.parts = tuple(int(p) - 1 if i % 2 else p for i, p in enumerate(parts) if i % 2 or p)
+        self.suffix = {"space": " ", "nothing": ""}.get(val(W_SUFF, "tab"), " ")
+        restart = val(W_LVL_RESTART)
+        self.restart = int(restart) if restart is not None else None  # None：上一级变化时重新开始；0：从不
+
+def level_table(abstract) -> List[Optional[ListLevel]]:
+    levels: List[Optional[ListLevel]] = [None] * LIST_LEVELS
+    for lvl in abstract.findall(W_LVL):
+        i = int(lvl.get(W_ILVL, "0"))
+        if 0 <= i < LIST_LEVELS:
+            levels[i] = ListLevel(lvl)
+    return levels
+
+class ListNumbering:
+    """
+    文档的自动编号：numId -> (计数器键, 各级定义)。
+    同一抽象编号的多个列表共用计数器（Word 的“继续编号”），带 startOverride 的列表（“重新开始编号”）单独计数。
+    """
+
+    def __init__(self, numbering_root, styles_root=None):
+        abstracts = {a.get(W_ABSTRACT_NUM_ID): level_table(a) for a in numbering_root.iter(W_ABSTRACT_NUM)}
+        self.lists: Dict[str, Tuple[Any, List[Optional[ListLevel]]]] = {}
+        for num in numbering_root.iter(W_NUM):
+            num_id = num.get(W_NUMID)
+            ref = num.find(W_ABSTRACT_NUM_ID)
+            abstract_id = ref.get(W_VAL) if ref is not None else None
+            if abstract_id not in abstracts:
+                continue
+            levels = list(abstracts[abstract_id])
+            key: Any = ("abstract", abstract_id)
+            for override in num.findall(W_LVL_OVERRIDE):
+                i = int(override.get(W_ILVL, "0"))
+                if not 0 <= i < LIST_LEVELS:
+                    continue
+                lvl = override.find(W_LVL)
+                if lvl is not None:
+                    levels[i] = ListLevel(lvl)
+                start = override.find(W_START_OVERRIDE)
+                if start is not None and levels[i] is not None:
+                    levels[i] = copy.copy(levels[i])
+                    levels[i].start = int(start.get(W_VAL, "1"))
+                key = ("num", num_id)
+            self.lists[num_id] = (key, levels)
+        self.style_numbering = self.style_table(styles_root) if styles_root is not None else {}
+        self.counters: Dict[Any, List[Optional[int]]] = {}
+
+    @staticmethod
+    def style_table(styles_root) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """段落样式自带的编号（如“列表编号”样式）：styleId -> (numId, ilvl)，沿 basedOn 继承"""
+        direct: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        based_on: Dict[str, str] = {}
+        for style in styles_root.iter(W_STYLE):
+            sid = style.get(W_STYLE_ID)
+            parent = style.find(W_BASED_ON)
+            if parent is not None:
+                based_on[sid] = parent.get(W_VAL)
+            numpr = style.find(f"{W_PPR}/{W_NUMPR}")
+            if numpr is not None:
+                num_id, ilvl = numpr.find(W_NUMID), numpr.find(W_ILVL)
+                direct[sid] = (num_id.get(W_VAL) if num_id is not None else None, ilvl.get(W_VAL) if ilvl is not None else None)
+        resolved = {}
+        for sid in set(direct) | set(based_on):
+            seen, cur = set(), sid
+            while cur is not None and cur not in direct and cur not in seen:
+                seen.add(cur)
+                cur = based_on.get(cur)
+            if cur in direct:
+                resolved[sid] = direct[cur]
+        return resolved
+
+    @classmethod
+    def from_zip(cls, zf: zipfile.ZipFile) -> Optional["ListNumbering"]:
+        """流式读取用：没有 numbering.xml 的文档返回 None"""
+        names = set(zf.namelist())
+        if "word/numbering.xml" not in names:
+            return None
+        styles = ET.fromstring(zf.read("word/styles.xml")) if "word/styles.xml" in names else None
+        return cls(ET.fromstring(zf.read("word/numbering.xml")), styles)
+
+    @classmethod
+    def from_document(cls, doc) -> Optional["ListNumbering"]:
+        """python-docx 文档用：直接取已加载的 numbering / styles 部件"""
+        from docx.opc.constants import RELATIONSHIP_TYPE as RT
+        try:
+            numbering = doc.part.part_related_by(RT.NUMBERING).element
+        except KeyError:
+            return None
+        return cls(numbering, doc.styles.element)
+
+    def label(self, p) -> str:
+        """段落的编号文本（含后缀，全角标点已转半角），不是编号段落时为空串；调用即计数，须按文档顺序逐段调用"""
+        ppr = p.find(W_PPR)
+        if ppr is None:
+            return ""
+        numpr = ppr.find(W_NUMPR)
+        style = ppr.find(W_PSTYLE)
+        from_style = self.style_numbering.get(style.get(W_VAL)) if style is not None else None
+        if numpr is None and from_style is None:
+            return ""
+        num_id = ilvl = None
+        if numpr is not None:
+            e = numpr.find(W_NUMID)
+            num_id = e.get(W_VAL) if e is not None else None
+            e = numpr.find(W_ILVL)
+            ilvl = e.get(W_VAL) if e is not None else None
+        if from_style is not None:
+            num_id = num_id if num_id is not None else from_style[0]
+            ilvl = ilvl if ilvl is not None else from_style[1]
+        entry = self.lists.get(num_id)  # numId 0 表示取消编号，不在表中
+        if entry is None:
+            return ""
+        key, levels = entry
+        level = int(ilvl or 0)
+        if not 0 <= level < LIST_LEVELS or levels[level] is None:
+            return ""
+        counters = self.counters.get(key)
+        if counters is None:
+            counters = self.counters[key] = [None] * LIST_LEVELS
+        lvl = levels[level]
+        counters[level] = lvl.start if counters[level] is None else counters[level] + 1
+        for deeper in range(level + 1, LIST_LEVELS):
+            d = levels[deeper]
+            if d is None or d.restart is None or level < d.restart:
+                counters[deeper] = None
+        if lvl.fmt in NO_LABEL_FORMATS:
+            return ""
+        out = []
+        for part in lvl.parts:
+            if isinstance(part, int):
+                ref = levels[part]
+                n = counters[part] if counters[part] is not None else (ref.start if ref is not None else 1)
+                out.append(format_list_number(n, ref.fmt if ref is not None else "decimal"))
+            else:
+                out.append(part)
+        # 编号模板里的全角标点（如“1）”“A．”）折成半角，才能被 RE_Q_START / RE_OPT 识别
+        return unicodedata.normalize("NFKC", "".join(out)) + lvl.suffix if out else ""
+
+# ---- 选项格式标记（--answer-format） ----
+# 有的题库不写“答案：”，而是把正确选项加粗、标红或突出显示。开启后读取器在逐段读取时顺带检查选项段落的 run 格式
+# （只看形如选项的段落，仍是同一遍遍历），被标记的段落以 DocLine（marked 为真）产出，解析器据此在题内没有答案行时补上答案。
+W_RPR = W_NS + "rPr"
+W_RSTYLE = W_NS + "rStyle"
+W_B = W_NS + "b"
+W_COLOR = W_NS + "color"
+W_HIGHLIGHT = W_NS + "highlight"
+W_SHD = W_NS + "shd"
+W_FILL = W_NS + "fill"
+MARK_BOLD, MARK_COLOR, MARK_HIGHLIGHT = 1, 2, 4
+ANSWER_FORMATS = {"bold": MARK_BOLD, "color": MARK_COLOR, "highlight": MARK_HIGHLIGHT, "any": MARK_BOLD | MARK_COLOR | MARK_HIGHLIGHT}
+OFF_VALUES = frozenset(("0", "false", "off"))
+
+def format_mask(spec: str) -> int:
+    """“bold,color” 之类的逗号列表 -> 标记位；空串为 0（不检查格式）"""
+    mask = 0
+    for name in filter(None, (s.strip() for s in spec.split(","))):
+        if name not in ANSWER_FORMATS:
+            raise ValueError(f"未知的答案格式：{name}（可选 {'、'.join(ANSWER_FORMATS)}）")
+        mask |= ANSWER_FORMATS[name]
+    return mask
+
+def is_red(val: Optional[str]) -> bool:
+    """w:color 的 RRGGBB 是否偏红（FF0000、C00000 等）；auto 与主题色不算"""
+    if not val or len(val) != 6:
+        return False
+    try:
+        r, g, b = int(val[0:2], 16), int(val[2:4], 16), int(val[4:6], 16)
+    except ValueError:
+        return False
+    return r >= 0x99 and g < 0x66 and b < 0x66
+
+def rpr_marks(rpr, marks: int) -> int:
+    """在已有标记位上叠加 w:rPr 的直接格式（显式关闭的加粗/颜色会清掉对应位）"""
+    e = rpr.find(W_B)
+    if e is not None:
+        marks = marks & ~MARK_BOLD if e.get(W_VAL, "true") in OFF_VALUES else marks | MARK_BOLD
+    e = rpr.find(W_COLOR)
+    if e is not None:
+        marks = marks | MARK_COLOR if is_red(e.get(W_VAL)) else marks & ~MARK_COLOR
+    e = rpr.find(W_HIGHLIGHT)
+    if e is not None:
+        marks = marks & ~MARK_HIGHLIGHT if e.get(W_VAL) == "none" else marks | MARK_HIGHLIGHT
+    e = rpr.find(W_SHD)
+    if e is not None and e.get(W_FILL, "auto").upper() not in ("AUTO", "FFFFFF", ""):
+        marks |= MARK_HIGHLIGHT
+    return marks
+
+class FormatMarks:
+    """
+    选项段落的格式标记：段落样式、字符样式（沿 basedOn 继承，打开文档时一次展开）与 run 的直接格式依次叠加。
+    选项正文（不计空白）过半被标记才算标记段落，避免选项里个别加粗的词被当成答案。
+    """
 
-    questions: List[Dict[str, Any]] = []
-    cur = {}
+    def __init__(self, mask: int, styles_root=None):
+        self.mask = mask
+        self.styles = self.style_marks(styles_root) if styles_root is not None else {}
+
+    @staticmethod
+    def style_marks(styles_root) -> Dict[str, int]:
+        direct: Dict[str, Any] = {}
+        based_on: Dict[str, str] = {}
+        for style in styles_root.iter(W_STYLE):
+            sid = style.get(W_STYLE_ID)
+            parent = style.find(W_BASED_ON)
+            if parent is not None:
+                based_on[sid] = parent.get(W_VAL)
+            direct[sid] = style.find(W_RPR)
+        resolved: Dict[str, int] = {}
+
+        def resolve(sid, seen):
+            if sid in resolved:
+                return resolved[sid]
+            if sid not in direct or sid in seen:
+                return 0
+            seen.add(sid)
+            marks = resolve(based_on.get(sid), seen)
+            rpr = direct[sid]
+            resolved[sid] = marks = rpr_marks(rpr, marks) if rpr is not None else marks
+            return marks
+
+        for sid in direct:
+            resolve(sid, set())
+        return resolved
+
+    @classmethod
+    def from_zip(cls, zf: zipfile.ZipFile, mask: int) -> "FormatMarks":
+        names = set(zf.namelist())
+        return cls(mask, ET.fromstring(zf.read("word/styles.xml")) if "word/styles.xml" in names else None)
+
+    @classmethod
+    def from_document(cls, doc, mask: int) -> "FormatMarks":
+        return cls(mask, doc.styles.element)
+
+    def marked(self, p, text: str) -> bool:
+        """text 为段落文本（已拼上自动编号）；不像选项的段落直接跳过，不看格式"""
+        if text.lstrip()[:1] not in OPTION_LEADS:
+            return False
+        base = 0
+        ppr = p.find(W_PPR)
+        if ppr is not None:
+            e = ppr.find(W_PSTYLE)
+            if e is not None:
+                base = self.styles.get(e.get(W_VAL), 0)
+        total = hit = 0
+        for child in p:
+            if child.tag == W_R:
+                runs = (child,)
+            elif child.tag == W_HYPERLINK:
+                runs = child.iter(W_R)
+            else:
+                continue
+            for r in runs:
+                n = len("".join(run_text(r).split()))
+                if not n:
+                    continue
+                marks = base
+                rpr = r.find(W_RPR)
+                if rpr is not None:
+                    e = rpr.find(W_RSTYLE)
+                    if e is not None:
+                        marks |= self.styles.get(e.get(W_VAL), 0)
+                    marks = rpr_marks(rpr, marks)
+                total += n
+                if marks & self.mask:
+                    hit += n
+        return hit * 2 > total
+
+# ---- 题目图片（--asset-dir） ----
+# parse_docx 原本只取段落文本，接线图之类的插图会丢失。开启后读取器在同一遍遍历中找出段落里的图片
+# （DrawingML 的 a:blip 与旧式 VML 的 v:imagedata），按内容哈希写入素材目录，题目里只记录引用路径，
+# 题库 JS 不会因为图片变大；同一张图片无论出现在几个题库、几道题里都只存一份。
+A_BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+V_IMAGEDATA = "{urn:schemas-microsoft-com:vml}imagedata"
+R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+R_EMBED = R_NS + "embed"
+R_ID = R_NS + "id"
+PKG_RELATIONSHIP = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+DOCUMENT_RELS = "word/_rels/document.xml.rels"
+
+class ImageAssets:
+    """
+    文档图片 -> 素材文件：文件名为内容 sha256 的前 16 位加原扩展名，已存在则不再写入。
+    load(rId) 返回 (图片字节, 扩展名)，不是内嵌图片时返回 None；每个 rId 只读取、哈希一次。
+    """
+
+    def __init__(self, asset_dir: Path, url: str, load):
+        self.asset_dir = Path(asset_dir)
+        self.url = url
+        self.load = load
+        self.refs: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def from_zip(cls, zf: zipfile.ZipFile, asset_dir: Path, url: str) -> "ImageAssets":
+        """流式读取用：从 document.xml.rels 取图片关系，按需从 zip 读出图片"""
+        targets: Dict[str, str] = {}
+        if DOCUMENT_RELS in zf.namelist():
+            for rel in ET.fromstring(zf.read(DOCUMENT_RELS)).iter(PKG_RELATIONSHIP):
+                if rel.get("TargetMode") == "External" or not rel.get("Type", "").endswith("/image"):
+                    continue
+                target = rel.get("Target", "")
+                targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath("word/" + target)
+
+        def load(rid: str) -> Optional[Tuple[bytes, str]]:
+            name = targets.get(rid)
+            if name is None:
+                return None
+            return zf.read(name), posixpath.splitext(name)[1]
+        return cls(asset_dir, url, load)
+
+    @classmethod
+    def from_document(cls, doc, asset_dir: Path, url: str) -> "ImageAssets":
+        """python-docx 文档用：图片部件已随文档加载"""
+        def load(rid: str) -> Optional[Tuple[bytes, str]]:
+            rel = doc.part.rels.get(rid)
+            if rel is None or rel.is_external or not rel.reltype.endswith("/image"):
+                return None
+            return rel.target_part.blob, posixpath.splitext(rel.target_part.partname)[1]
+        return cls(asset_dir, url, load)
+
+    def ref(self, rid: Optional[str]) -> Optional[str]:
+        if rid is None:
+            return None
+        if rid not in self.refs:
+            loaded = self.load(rid)
+            self.refs[rid] = self.store(*loaded) if loaded is not None else None
+        return self.refs[rid]
+
+    def store(self, blob: bytes, ext: str) -> str:
+        name = hashlib.sha256(blob).hexdigest()[:16] + ext.lower()
+        path = self.asset_dir / name
+        if not path.exists():
+            self.asset_dir.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再改名：批量模式多个进程可能同时写同一张图片
+            tmp = path.with_name(f".{name}.{os.getpid()}.tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+        return self.url + name
+
+    def paragraph_images(self, p) -> Tuple[str, ...]:
+        """段落内图片的引用路径（按出现顺序去重；兼容格式里同一图片的 DrawingML 与 VML 两份只算一张）"""
+        refs: Dict[str, None] = {}
+        for e in p.iter():
+            if e.tag == A_BLIP:
+                ref = self.ref(e.get(R_EMBED))
+            elif e.tag == V_IMAGEDATA:
+                ref = self.ref(e.get(R_ID))
+            else:
+                continue
+            if ref is not None:
+                refs[ref] = None
+        return tuple(refs)
+
+def asset_url(asset_dir: Path, out_path: Path) -> str:
+    """题目里图片的引用路径前缀：素材目录相对于输出 JS 所在目录（即 主程序.html 所在目录）"""
+    return Path(os.path.relpath(asset_dir, out_path.parent)).as_posix() + "/"
+
+# ---- Word 公式（OMML -> MathML，--math） ----
+# 公式编辑器写的公式是段落里的 m:oMath / m:oMathPara，不在 p.text 里，转换后整条公式丢失。
+# 开启后在读取段落时把公式转成 MathML 拼进段落文本，主程序.html 用 innerHTML 显示题目，浏览器原生渲染，
+# 不需要任何前端数学库。转换结果随整份文档进入转换缓存（ConversionCache），文档未修改时不会重新转换；
+# 不再单独按公式缓存：计算公式的结构哈希要遍历整棵子树，耗时与转换本身相当，省不下时间。
+M_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/math}"
+M_OMATH = M_NS + "oMath"
+M_OMATH_PARA = M_NS + "oMathPara"
+M_T = M_NS + "t"
+M_VAL = M_NS + "val"
+RE_MATH_TOKEN = re.compile(r"\d+(?:\.\d+)?|[^\W\d_]|\S")
+INTEGRALS = frozenset("∫∬∭∮∯∰∱∲∳")
+
+def m_prop(e, pr: str, name: str, default: Optional[str] = None) -> Optional[str]:
+    """公式对象的属性（如 m:dPr/m:begChr 的 m:val）；属性元素存在但不带 val 时为空串"""
+    prop = e.find(f"{M_NS}{pr}/{M_NS}{name}")
+    return default if prop is None else prop.get(M_VAL, "")
+
+def m_on(e, pr: str, name: str) -> bool:
+    """开关属性（如 m:radPr/m:degHide）：存在且不是 0/off/false 即为开"""
+    val = m_prop(e, pr, name)
+    return val is not None and val not in OFF_VALUES
+
+def mathml_row(e) -> str:
+    return f"<mrow>{omml_children(e)}</mrow>" if e is not None else "<mrow></mrow>"
+
+def mathml_arg(e, name: str) -> str:
+    """脚本、分式等的一个参数：MathML 要求恰好一个子元素，统一包成 mrow"""
+    return mathml_row(e.find(M_NS + name))
+
+def mathml_tokens(text: str, plain: bool = False) -> str:
+    """公式文本拆成 mn（数）/ mi（字母）/ mo（其他符号）；plain（m:sty 为 p）时字母按正体整段输出"""
+    out = []
+    for tok in RE_MATH_TOKEN.findall(text):
+        esc = html.escape(tok, quote=False)
+        if tok[0].isdigit():
+            out.append(f"<mn>{esc}</mn>")
+        elif tok.isalpha():
+            if plain and out and out[-1].startswith('<mi mathvariant="normal">'):
+                out[-1] = out[-1][:-5] + esc + "</mi>"
+            else:
+                out.append(f'<mi mathvariant="normal">{esc}</mi>' if plain else f"<mi>{esc}</mi>")
+        else:
+            out.append(f"<mo>{esc}</mo>")
+    return "".join(out)
+
+def omml_run(r) -> str:
+    text = "".join(t.text or "" for t in r if t.tag in (M_T, W_T))
+    if not text:
+        return ""
+    if r.find(f"{M_NS}rPr/{M_NS}nor") is not None:
+        return f"<mtext>{html.escape(text, quote=False)}</mtext>"
+    return mathml_tokens(text, plain=m_prop(r, "rPr", "sty") == "p")
+
+def omml_nary(e) -> str:
+    """∑、∫ 等大型运算符：上下限按 limLoc 放在正上下方或右上下角，积分号默认角标"""
+    chr_ = m_prop(e, "naryPr", "chr") or "∫"
+    op = f'<mo largeop="true">{html.escape(chr_, quote=False)}</mo>'
+    lim = m_prop(e, "naryPr", "limLoc") or ("subSup" if chr_ in INTEGRALS else "undOvr")
+    sub = None if m_on(e, "naryPr", "subHide") else mathml_arg(e, "sub")
+    sup = None if m_on(e, "naryPr", "supHide") else mathml_arg(e, "sup")
+    under, over, both = ("munder", "mover", "munderover") if lim == "undOvr" else ("msub", "msup", "msubsup")
+    if sub and sup:
+        op = f"<{both}>{op}{sub}{sup}</{both}>"
+    elif sub:
+        op = f"<{under}>{op}{sub}</{under}>"
+    elif sup:
+        op = f"<{over}>{op}{sup}</{over}>"
+    return f"<mrow>{op}{mathml_arg(e, 'e')}</mrow>"
+
+def omml_delimiter(e) -> str:
+    beg = m_prop(e, "dPr", "begChr", "(")
+    end = m_prop(e, "dPr", "endChr", ")")
+    sep = m_prop(e, "dPr", "sepChr", "|")
+    items = [omml_children(x) for x in e.findall(M_NS + "e")]
+    inner = f'<mo separator="true">{html.escape(sep, quote=False)}</mo>'.join(items)
+    fence = lambda c: f'<mo fence="true">{html.escape(c, quote=False)}</mo>' if c else ""
+    return f"<mrow>{fence(beg)}{inner}{fence(end)}</mrow>"
+
+def omml_func(e) -> str:
+    """函数名（sin、log…）整段正体输出，后接不可见的函数作用符"""
+    name = e.find(M_NS + "fName")
+    runs = list(name) if name is not None else []
+    if runs and all(r.tag == M_NS + "r" for r in runs):
+        text = "".join(t.text or "" for r in runs for t in r if t.tag == M_T)
+        fname = f"<mi>{html.escape(text, quote=False)}</mi>"
+    else:
+        fname = mathml_row(name)
+    return f"<mrow>{fname}<mo>&#x2061;</mo>{mathml_arg(e, 'e')}</mrow>"
+
+def omml_radical(e) -> str:
+    deg = e.find(M_NS + "deg")
+    if m_on(e, "radPr", "degHide") or deg is None or not omml_children(deg):
+        return f"<msqrt>{omml_children(e.find(M_NS + 'e'))}</msqrt>"
+    return f"<mroot>{mathml_arg(e, 'e')}{mathml_row(deg)}</mroot>"
+
+def omml_fraction(e) -> str:
+    kind = m_prop(e, "fPr", "type", "bar")
+    num, den = mathml_arg(e, "num"), mathml_arg(e, "den")
+    if kind == "lin":
+        return f"<mrow>{num}<mo>/</mo>{den}</mrow>"
+    return f'<mfrac linethickness="0">{num}{den}</mfrac>' if kind == "noBar" else f"<mfrac>{num}{den}</mfrac>"
+
+def omml_table(rows) -> str:
+    return "<mtable>" + "".join("<mtr>" + "".join(f"<mtd>{omml_children(c)}</mtd>" for c in cells) + "</mtr>" for cells in rows) + "</mtable>"
+
+def omml_over_under(e, pr: str, default_chr: str, default_pos: str) -> str:
+    """重音、上下划线、组合字符：按 pos 放在上方（mover）或下方（munder）"""
+    chr_ = m_prop(e, pr, "chr") or default_chr
+    tag = "mover" if (m_prop(e, pr, "pos") or default_pos) == "top" else "munder"
+    accent = ' accent="true"' if tag == "mover" else ""
+    return f"<{tag}{accent}>{mathml_arg(e, 'e')}<mo>{html.escape(chr_, quote=False)}</mo></{tag}>"
+
+OMML_CONVERTERS = {
+    M_NS + "r": omml_run,
+    M_NS + "f": omml_fraction,
+    M_NS + "sSup": lambda e: f"<msup>{mathml_arg(e, 'e')}{mathml_arg(e, 'sup')}</msup>",
+    M_NS + "sSub": lambda e: f"<msub>{mathml_arg(e, 'e')}{mathml_arg(e, 'sub')}</msub>",
+    M_NS + "sSubSup": lambda e: f"<msubsup>{mathml_arg(e, 'e')}{mathml_arg(e, 'sub')}{mathml_arg(e, 'sup')}</msubsup>",
+    M_NS + "sPre": lambda e: f"<mmultiscripts>{mathml_arg(e, 'e')}<mprescripts/>{mathml_arg(e, 'sub')}{mathml_arg(e, 'sup')}</mmultiscripts>",
+    M_NS + "rad": omml_radical,
+    M_NS + "d": omml_delimiter,
+    M_NS + "nary": omml_nary,
+    M_NS + "func": omml_func,
+    M_NS + "acc": lambda e: omml_over_under(e, "accPr", "\u0302", "top"),
+    M_NS + "bar": lambda e: omml_over_under(e, "barPr", "¯" if m_prop(e, "barPr", "pos") == "top" else "_", "bot"),
+    M_NS + "groupChr": lambda e: omml_over_under(e, "groupChrPr", "⏟", "bot"),
+    M_NS + "limLow": lambda e: f"<munder>{mathml_arg(e, 'e')}{mathml_arg(e, 'lim')}</munder>",
+    M_NS + "limUpp": lambda e: f"<mover>{mathml_arg(e, 'e')}{mathml_arg(e, 'lim')}</mover>",
+    M_NS + "m": lambda e: omml_table(r.findall(M_NS + "e") for r in e.findall(M_NS + "mr")),
+    M_NS + "eqArr": lambda e: omml_table([x] for x in e.findall(M_NS + "e")),
+    M_NS + "borderBox": lambda e: f'<menclose notation="box">{mathml_arg(e, "e")}</menclose>',
+    M_NS + "phant": lambda e: f"<mphantom>{mathml_arg(e, 'e')}</mphantom>" if m_prop(e, "phantPr", "show") in OFF_VALUES else mathml_arg(e, "e"),
+    W_R: lambda r: f"<mtext>{html.escape(run_text(r), quote=False)}</mtext>" if run_text(r).strip() else "",
+}
+
+def omml_node(e) -> str:
+    convert = OMML_CONVERTERS.get(e.tag)
+    if convert is not None:
+        return convert(e)
+    tag = e.tag if isinstance(e.tag, str) else ""
+    if tag.endswith("Pr"):
+        return ""  # m:rPr、m:dPr、m:ctrlPr 等属性元素
+    # m:e、m:num、m:box 等容器以及未知元素：照常转换子元素
+    return omml_children(e)
+
+def omml_children(e) -> str:
+    return "".join(omml_node(c) for c in e) if e is not None else ""
+
+def math_markup(e) -> str:
+    """m:oMath（行内）或 m:oMathPara（独立成段，display="block"）-> MathML"""
+    if e.tag == M_OMATH_PARA:
+        return "".join(f'<math display="block">{omml_children(m)}</math>' for m in e.iter(M_OMATH))
+    return f"<math>{omml_children(e)}</math>"
+
+def parse_docx(docx_path: Path, start_number: int = 1, respect_word_number: bool = False, stream: bool = False, stats: Optional[ConvertStats] = None,
+               answer_key: bool = False, key_report: Optional[Dict[str, List[Any]]] = None, auto_number: bool = True,
+               answer_format: str = "", asset_dir: Optional[Path] = None, asset_url: str = "", math: bool = False,
+               explanations: bool = False) -> List[Question]:
+    lines = iter_docx_lines(docx_path, stream=stream, tables=answer_key, numbering=auto_number, answer_format=answer_format,
+                            asset_dir=asset_dir, asset_url=asset_url, math=math)
+    key_opts = {"answer_key": answer_key, "key_report": key_report, "explanations": explanations}
+    if stats is None:
+        return parse_lines(lines, start_number=start_number, respect_word_number=respect_word_number, **key_opts)
+    with stats.stage("parse"):
+        q_list = parse_lines(stats.timed_iter(lines, "load"), start_number=start_number, respect_word_number=respect_word_number, stats=stats, **key_opts)
+    # 行分类耗时 = 解析总耗时 - 读取 - 答案规范化
+    stats.add_time("classify", stats.times["parse"] - stats.times.get("load", 0.0) - stats.times.get("normalize", 0.0))
+    return q_list
+
+def iter_questions(source, start_number: int = 1, respect_word_number: bool = False, stream: bool = True,
+                   answer_key: bool = False, key_report: Optional[Dict[str, List[Any]]] = None, auto_number: bool = True,
+                   answer_format: str = "", asset_dir: Optional[Path] = None, asset_url: str = "", math: bool = False,
+                   explanations: bool = False) -> Iterator[Question]:
+    """
+    库接口：逐题产出 docx 中解析出的题目（Question），不把整个题库留在内存里。
+    source 为路径或二进制文件对象；默认用流式读取（不依赖 python-docx），stream=False 时改用 python-docx。
+    题目可用 to_dict() 转成输出格式的字典，或直接交给 write_bank 写出。
+    answer_key 为真时从文末答案表补答案（见 iter_parse_lines），题目要等到答案表读完才产出；
+    auto_number 为假时不解析 Word 自动编号（题号、选项字母只认正文里手打的）；
+    answer_format（如 "bold"、"color,highlight"、"any"）不为空时，没有“答案：”行的题以带该格式的选项为答案；
+    asset_dir 不为空时把题目里的图片按内容哈希写入该目录，题目的 images 记录 asset_url + 文件名（默认用目录名）；
+    math 为真时 Word 公式以 MathML 写进题干与选项文字；
+    explanations 为真时识别“解析：”段落，存入题目的 explanation（否则照旧当作题干）。
+    """
+    if asset_dir is not None and not asset_url:
+        asset_url = Path(asset_dir).name + "/"
+    lines = iter_docx_lines(source, stream=stream, tables=answer_key, numbering=auto_number, answer_format=answer_format,
+                            asset_dir=asset_dir, asset_url=asset_url, math=math)
+    return iter_parse_lines(lines, start_number=start_number, respect_word_number=respect_word_number, answer_key=answer_key,
+                            key_report=key_report, explanations=explanations)
+
+def parse_lines(lines, start_number: int = 1, respect_word_number: bool = False, stats: Optional[ConvertStats] = None,
+                answer_key: bool = False, key_report: Optional[Dict[str, List[Any]]] = None, explanations: bool = False) -> List[Question]:
+    """逐行状态机：把已去空白的段落文本解析为题目列表；stats 不为空时记录分类计数"""
+    return list(iter_parse_lines(lines, start_number=start_number, respect_word_number=respect_word_number, stats=stats,
+                                 answer_key=answer_key, key_report=key_report, explanations=explanations))
+
+def iter_parse_lines(lines, start_number: int = 1, respect_word_number: bool = False, stats: Optional[ConvertStats] = None,
+                     answer_key: bool = False, key_report: Optional[Dict[str, List[Any]]] = None, explanations: bool = False) -> Iterator[Question]:
+    """
+    parse_lines 的生成器版本：每遇到下一题起始即产出上一题，内存只保留当前题。
+    answer_key 为真时识别答案表（“参考答案”标题、“1-5 CABDA”区间、“1.A 2.B”条目、答案表格）：
+    题目先挂起，答案表结束时按 Word 题号从哈希表补上缺少的答案（题内已有“答案：”的以题内为准）再依次产出，
+    整个过程只读一遍文档；key_report 不为空时记录 unanswered（仍无答案的题号）、unused（答案表中无对应题的题号）
+    与 bad_lines（答案表中无法识别的区间行，如答案个数与题数不符）。
+    选项行为 DocLine 且 marked 为真（读取时按 --answer-format 检出的加粗/标红/突出显示选项）、题内没有“答案：”行时，以这些选项为答案；
+    DocLine 带的图片（--asset-dir）：选项段落里的归到该选项（只有“A.”没有文字、只带图片的段落也算选项），
+    其余按顺序记入当前题的 images；同一张图只记一次。
+    explanations 为真时“解析：”（或“【解析】”“答案解析：”）开始解析段，直到下一题为止的题干/选项行都归入解析
+    （其间的“答案：”行仍作答案），各行以换行相连存入 explanation。
+    """
+    questions: List[Question] = []  # 本次 flush 收录的题（至多一道），产出后清空
+    emitted = 0
+    cur: Optional[Question] = None
+    # 题干分段收集，flush 时一次拼接清洗，避免长题干每追加一行都重新 clean 整段
+    stem: List[str] = []
+    marked: List[str] = []  # 当前题带格式标记的选项字母
+    explain: List[str] = []  # 当前题的解析行
+    in_explain = False
     auto_num = start_number
+    # 答案表模式
+    key_mode = False  # 正在读答案表
+    key: Dict[int, str] = {}  # Word 题号 -> 答案文本
+    key_table: Dict[str, Any] = {}  # 横排答案表格的上一行题号
+    pending: List[Tuple[int, Question]] = []  # 等待答案表的 (Word 题号, 题目)
+    doc_num = 0
 
     def set_number(n: int):
-        cur["number"] = n
+        cur.number = n
+
+    def hold():
+        pending.extend((doc_num, q) for q in questions)
+        questions.clear()
+
+    def join_key():
+        """按题号把答案表并入挂起的题，挂起的题转入 questions 等待产出"""
+        used = set()
+        for n, q in pending:
+            if n in key:
+                used.add(n)
+                if not q.answer:
+                    q.answer = key_answer(key[n], q.type)
+            if not q.answer and key_report is not None:
+                key_report.setdefault("unanswered", []).append(n)
+            questions.append(q)
+        if key_report is not None:
+            key_report.setdefault("unused", []).extend(sorted(set(key) - used))
+        pending.clear()
+        key.clear()
+
+    def flush():
+        if cur is not None:
+            cur.question = clean(" ".join(stem))
+            if marked and not cur.answer:
+                cur.answer = tuple(dict.fromkeys(marked))
+                if stats is not None:
+                    stats.count("answer_from_format")
+            if explain:
+                cur.explanation = "\n".join(explain)
+        marked.clear()
+        explain.clear()
+        if stats is not None:
+            stats.count("dropped_empty_stem", flush_dropped(questions, cur))
+        else:
+            flush_current(questions, cur)
+
+    for raw in itertools.chain(lines, [""]):  # 末尾补空行，便于 flush
+        if answer_key:
+            if isinstance(raw, TableRow):
+                entries = parse_key_row(raw.cells, key_table)
+                starts_key = bool(entries)
+            else:
+                text = raw.strip()
+                ranged = RE_KEY_RANGE_LEAD.match(text)
+                entries = parse_key_line(text) if key_mode or ranged else None
+                starts_key = entries is not None or bool(RE_KEY_HEAD.match(text))
+                if key_mode and ranged and entries is None and key_report is not None:
+                    key_report.setdefault("bad_lines", []).append(text)
+            if starts_key:
+                if not key_mode:
+                    # 进入答案表：当前题到此结束
+                    flush()
+                    hold()
+                    cur, stem, key_mode, in_explain = None, [], True, False
+                key.update(entries or ())
+                if stats is not None:
+                    stats.count("line_key")
+                continue
+            if isinstance(raw, TableRow):
+                continue  # 不是答案表的表格照旧忽略
 
-    for raw in lines + [""]:  # 末尾补空行，便于 flush
         line = raw.strip()
+        kind, m = classify_line(line)
+        images = raw.images if isinstance(raw, DocLine) else ()
+        if images and kind == LINE_TEXT and line[:1] in OPTION_LEADS:
+            m = RE_OPT_BARE.match(line)
+            if m:
+                kind = LINE_OPTION
 
         # 识别“题起始”
-        m = RE_Q_START.match(line)
-        if m:
+        if kind == LINE_Q_START:
             # 如果已有缓冲题，先收录
-            flush_current(questions, cur)
-            cur = {"options": [], "answer": []}
+            if stats is not None:
+                stats.count("line_q_start")
+            flush()
+            in_explain = False
+            if answer_key:
+                hold()
+                if key_mode:
+                    key_mode = False
+                    join_key()
+            if questions:
+                emitted += len(questions)
+                yield from questions
+                questions.clear()
 
-            num_in_doc = int(m.group("num"))
+            num_in_doc = doc_num = int(m.group("num"))
             typedesc = m.group("typedesc")
             qtext = m.group("qtext").strip()
 
             # 题型有两种写法：紧跟题号，或写在题干末尾，这里两处都尝试。
             typ2, qtext2 = extract_type_from_text(qtext)
             q_type = typedesc or typ2 or "单选"  # 默认为单选
+            if stats is not None and typ2:
+                stats.count("type_at_end")
 
-            cur["type"] = q_type
-            cur["question"] = clean(qtext2 if typ2 else qtext)
+            # 解析期间选项先收集在列表里，flush 时转为元组
+            cur = Question(type=q_type, options=[])
+            stem = [qtext2]
 
             if respect_word_number:
                 set_number(num_in_doc)
@@ -181,101 +1453,1793 @@ def parse_docx(docx_path: Path, start_number: int = 1, respect_word_number: bool
             else:
                 set_number(auto_num)
                 auto_num += 1
+            if images:
+                cur.images = add_images(cur.images, images)
+            continue
+
+        if cur is None:
+            # 第一道题之前的内容忽略
+            if stats is not None and line:
+                stats.count("line_ignored")
             continue
 
+        # 解析：开始后直到下一题的题干/选项行都属于解析
+        if explanations:
+            mx = RE_EXPLAIN.match(line) if line[:1] in EXPLAIN_LEADS else None
+            if mx or (in_explain and (kind == LINE_TEXT or kind == LINE_OPTION)):
+                in_explain = True
+                text = clean(mx.group(1) if mx else line)
+                if text:
+                    explain.append(text)
+                if images:
+                    cur.images = add_images(cur.images, images)
+                if stats is not None:
+                    stats.count("line_explain")
+                continue
+
         # 选项
-        m2 = RE_OPT.match(line)
-        if m2 and cur:
-            label = m2.group(1).upper()
-            text = m2.group(2)
-            cur.setdefault("options", []).append({"label": label, "text": clean(text)})
+        if kind == LINE_OPTION:
+            label = m.group(1).upper()
+            text = m.group(2) if m.re is RE_OPT else ""
+            cur.options.append((label, clean(text)))
+            if images:
+                if cur.option_images is None:
+                    cur.option_images = {}
+                cur.option_images[label] = add_images(cur.option_images.get(label, ()), images)
+            if isinstance(raw, DocLine) and raw.marked:
+                marked.append(label)
+            if stats is not None:
+                stats.count("line_option")
             continue
 
+        if images:
+            cur.images = add_images(cur.images, images)
+
         # 答案
-        m3 = RE_ANS.match(line)
-        if m3 and cur:
-            ans_text = m3.group(1)
-            cur["answer"] = normalize_answers(ans_text, cur.get("type", "单选"))
+        if kind == LINE_ANSWER:
+            ans_text = m.group(1)
+            if stats is not None:
+                stats.count("line_answer")
+                t0 = time.perf_counter()
+                cur.answer = tuple(normalize_answers(ans_text, cur.type))
+                stats.add_time("normalize", time.perf_counter() - t0)
+            else:
+                cur.answer = tuple(normalize_answers(ans_text, cur.type))
             continue
 
         # 普通文本：当作题干追加（换行拼接）
-        if cur and line:
+        if kind == LINE_TEXT:
             # 如果行尾带题型再提取一次（兼容“题干最后标注(单选)”）
             typ2, body2 = extract_type_from_text(line)
             if typ2:
-                cur["type"] = typ2
-                line = body2
-            cur["question"] = clean((cur.get("question", "") + " " + line).strip())
+                cur.type = sys.intern(typ2)
+            stem.append(body2)
+            if stats is not None:
+                stats.count("line_text")
+                if typ2:
+                    stats.count("type_at_end")
 
         # 空行：认为一个题块结束点之一，但不要强制 flush（答案可能在后面几行）
         # 这里不在空行处 flush，统一等下一题或文档结束时 flush
 
     # 结束时 flush
-    flush_current(questions, cur)
-    return questions
+    flush()
+    if answer_key:
+        hold()
+        join_key()
+    yield from questions
+    if stats is not None:
+        stats.count("questions", emitted + len(questions))
+        classified = sum(stats.counts.get(k, 0) for k in ("line_q_start", "line_option", "line_answer", "line_text", "line_ignored", "line_key", "line_explain"))
+        stats.count("line_blank", stats.counts.get("lines", 0) - classified)
+
+def flush_dropped(q_list: List[Question], buf: Optional[Question]) -> int:
+    """flush_current 并返回是否因题干为空丢弃了缓冲题（用于统计）"""
+    before = len(q_list)
+    flush_current(q_list, buf)
+    return int(buf is not None and len(q_list) == before)
+
+# ---- 读取现有题库（--append-to） ----
+class BankFormatError(ValueError):
+    """现有题库文件不是可识别的 window.<名称> = … 格式；消息中带行列位置"""
+
+RE_BANK_HEAD = re.compile(r"\s*window\s*\.\s*([A-Za-z_$][\w$]*)\s*=\s*")
+RE_SHARD_CALL = re.compile(r"\s*window\s*\.\s*questionsShardLoaded\s*\(\s*")
+RE_JSON_PARSE_CALL = re.compile(r"JSON\s*\.\s*parse\s*\(\s*'")
+RE_CLOSE_PAREN = re.compile(r"\s*\)")
+RE_COMMA = re.compile(r"\s*,\s*")
+RE_STATEMENT_END = re.compile(r"\s*;?\s*")
+RE_JS_ESCAPE = re.compile(r"\\(u\{[0-9a-fA-F]+\}|u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|\r\n|[\s\S])")
+JS_SIMPLE_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "b": "\b", "f": "\f", "v": "\v", "0": "\0", "\n": "", "\r": "", "\r\n": "", "\u2028": "", "\u2029": ""}
+JSON_DECODER = json.JSONDecoder()
 
-def merge_existing(js_path: Path, new_list: List[Dict[str, Any]], renumber_after_merge: bool = False, start_number: int = 1) -> List[Dict[str, Any]]:
-    if not js_path.exists():
-        return new_list
+def text_position(text: str, pos: int) -> str:
+    line = text.count("\n", 0, pos) + 1
+    col = pos - text.rfind("\n", 0, pos)
+    return f"第 {line} 行第 {col} 列"
 
-    text = js_path.read_text(encoding="utf-8")
-    m = re.search(r"window\.questionsData\s*=\s*(\[[\s\S]*?\])\s*;", text)
+def unescape_js_string(body: str) -> str:
+    def repl(m):
+        esc = m.group(1)
+        if esc[0] == "u" and len(esc) > 1:
+            return chr(int(esc[2:-1] if esc[1] == "{" else esc[1:], 16))
+        if esc[0] == "x" and len(esc) > 1:
+            return chr(int(esc[1:], 16))
+        return JS_SIMPLE_ESCAPES.get(esc, esc)
+    return RE_JS_ESCAPE.sub(repl, body) if "\\" in body else body
+
+def parse_js_value(text: str, pos: int, where: str) -> Tuple[Any, int]:
+    """
+    从 pos 起读取一个值，返回 (值, 结束位置)。支持本脚本输出的两种写法：
+    JSON 字面量（数组/对象，缩进或压缩均可），以及 JSON.parse('…')。
+    JSON 由 json 模块的 C 扫描器一次线性扫描完成，出错时报告文件中的行列位置。
+    """
+    m = RE_JSON_PARSE_CALL.match(text, pos)
+    if m:
+        # 找到未被转义的结束单引号：往前数反斜杠个数，偶数个才是真正的结束
+        start = i = m.end()
+        while True:
+            i = text.find("'", i)
+            if i < 0:
+                raise BankFormatError(f"{where}：JSON.parse 字符串没有结束引号（始于{text_position(text, start)}）")
+            k = i
+            while text[k - 1] == "\\":
+                k -= 1
+            if (i - k) % 2 == 0:
+                break
+            i += 1
+        close = RE_CLOSE_PAREN.match(text, i + 1)
+        if not close:
+            raise BankFormatError(f"{where}：{text_position(text, i + 1)} 缺少 JSON.parse 的右括号")
+        try:
+            value = json.loads(unescape_js_string(text[start:i]))
+        except ValueError as e:
+            raise BankFormatError(f"{where}：JSON.parse 字符串（始于{text_position(text, start)}）内容不是合法 JSON：{e}") from None
+        return value, close.end()
+    try:
+        return JSON_DECODER.raw_decode(text, pos)
+    except json.JSONDecodeError as e:
+        raise BankFormatError(f"{where}：{text_position(text, e.pos)} 不是合法 JSON：{e.msg}") from None
+
+def expect_statement_end(text: str, pos: int, where: str):
+    m = RE_STATEMENT_END.match(text, pos)
+    if m.end() != len(text):
+        raise BankFormatError(f"{where}：{text_position(text, m.end())} 起有多余内容")
+
+def read_bank_text(path: Path) -> str:
+    # utf-8-sig：兼容记事本保存时加的 BOM
+    return path.read_text(encoding="utf-8-sig")
+
+def read_bank(js_path: Path) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    读取本脚本生成的题库文件，返回 (变量名, 题目字典列表)。
+    接受任意 window.<名称> = …（questionsData、plcQuestionsData 等），内容可以是对象数组、
+    JSON.parse('…')、列式结构（--format columnar）或分片清单（--shard-size，会读取同目录的分片文件）。
+    格式不对时抛出 BankFormatError。
+    """
+    text = read_bank_text(js_path)
+    where = str(js_path)
+    m = RE_BANK_HEAD.match(text)
     if not m:
-        # 不是预期格式，直接追加
-        return new_list
+        raise BankFormatError(f"{where}：开头不是 window.<变量名> = …")
+    value, end = parse_js_value(text, m.end(), where)
+    expect_statement_end(text, end, where)
+    return m.group(1), bank_questions(value, js_path, where)
+
+def bank_questions(value: Any, js_path: Path, where: str) -> List[Dict[str, Any]]:
+    if isinstance(value, list):
+        return value
+    fmt = value.get("format") if isinstance(value, dict) else None
+    if fmt == "columnar":
+        return decode_columns(value)
+    if fmt == "sharded":
+        return read_sharded(value, js_path)
+    raise BankFormatError(f"{where}：题库内容既不是数组，也不是列式或分片格式")
+
+def read_sharded(manifest: Dict[str, Any], js_path: Path) -> List[Dict[str, Any]]:
+    """按清单读取全部分片，按题目在整体中的位置还原列表"""
+    questions: List[Any] = [None] * manifest.get("total", 0)
+    for rng in manifest.get("ranges", []):
+        for shard in rng.get("shards", []):
+            shard_path = js_path.parent / shard["file"]
+            where = str(shard_path)
+            try:
+                text = read_bank_text(shard_path)
+            except OSError as e:
+                raise BankFormatError(f"{where}：无法读取分片（{e}）") from None
+            m = RE_SHARD_CALL.match(text)
+            if not m:
+                raise BankFormatError(f"{where}：开头不是 window.questionsShardLoaded(…)")
+            _, pos = parse_js_value(text, m.end(), where)  # 分片文件名
+            comma = RE_COMMA.match(text, pos)
+            if not comma:
+                raise BankFormatError(f"{where}：{text_position(text, pos)} 缺少逗号")
+            payload, pos = parse_js_value(text, comma.end(), where)
+            close = RE_CLOSE_PAREN.match(text, pos)
+            if not close:
+                raise BankFormatError(f"{where}：{text_position(text, pos)} 缺少右括号")
+            expect_statement_end(text, close.end(), where)
+            items = payload["questions"]
+            if isinstance(items, dict):
+                items = decode_columns(items)
+            for pos_in_range, q in zip(payload["pos"], items):
+                questions[rng["start"] + pos_in_range] = q
+    if any(q is None for q in questions):
+        raise BankFormatError(f"{js_path}：分片不完整，缺少部分题目")
+    return questions
 
+def bank_var_name(js_path: Path) -> Optional[str]:
+    """只读文件开头，取出现有题库的变量名；文件不存在或不是题库时返回 None"""
     try:
-        old_list = json.loads(m.group(1))
-    except Exception:
-        old_list = []
+        with open(js_path, encoding="utf-8-sig") as f:
+            head = f.read(256)
+    except OSError:
+        return None
+    m = RE_BANK_HEAD.match(head)
+    return m.group(1) if m else None
 
-    merged = list(old_list) + list(new_list)
+DEFAULT_VAR_NAME = "questionsData"
+RE_JS_IDENT = re.compile(r"^[A-Za-z_$][\w$]*$")
 
-    if renumber_after_merge:
-        n = start_number
-        for item in merged:
-            item["number"] = n
-            n += 1
-    return merged
+# 文本输出的换行与原先 write_text 的文本模式一致（Windows 上为 \r\n）
+OUTPUT_NEWLINE = os.linesep.encode("ascii")
+
+def write_atomic(path: Path, blocks) -> bool:
+    """
+    把字节块依次写入 path，返回是否实际改写了文件。
+    边写边与现有文件比较：内容完全相同时不创建临时文件、不动原文件（修改时间不变，
+    浏览器缓存与文件监视都不受影响）；出现第一处差异后，才把已相同的前缀和剩余内容写入同目录临时文件，
+    写完后 os.replace 原子替换，中途出错不会留下写了一半的输出。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    old = open(path, "rb") if path.is_file() else None
+    tmp = None
+    same = 0  # 与现有文件一致的前缀字节数
+    try:
+        for data in blocks:
+            if tmp is None and old is not None and old.read(len(data)) == data:
+                same += len(data)
+                continue
+            if tmp is None:
+                tmp = open(tmp_path, "wb")
+                if same:
+                    old.seek(0)
+                    tmp.write(old.read(same))
+            tmp.write(data)
+        if tmp is None:
+            if old is not None and not old.read(1):
+                return False
+            # 新内容是现有文件的真前缀（或没有现有文件）
+            tmp = open(tmp_path, "wb")
+            if same:
+                old.seek(0)
+                tmp.write(old.read(same))
+        tmp.close()
+        if old is not None:
+            old.close()  # Windows 上替换前必须先关闭
+        os.replace(tmp_path, path)
+        return True
+    except BaseException:
+        if tmp is not None:
+            tmp.close()
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        raise
+    finally:
+        if old is not None:
+            old.close()
+
+def write_chunks(target, chunks: Iterator[str]) -> bool:
+    """把文本块依次写入 target（路径或可写文本文件对象），不在内存中拼出整个文件；路径时经 write_atomic 写出"""
+    if hasattr(target, "write"):
+        for chunk in chunks:
+            target.write(chunk)
+        return True
+    encoded = (chunk.encode("utf-8") for chunk in chunks)
+    if OUTPUT_NEWLINE != b"\n":
+        encoded = (data.replace(b"\n", OUTPUT_NEWLINE) for data in encoded)
+    return write_atomic(Path(target), encoded)
+
+def js_item_encoder() -> json.JSONEncoder:
+    return json.JSONEncoder(ensure_ascii=False, indent=2, default=question_json)
+
+def encode_js_item(encoder: json.JSONEncoder, q: Any) -> str:
+    # 单题缩进 2 级后作为数组元素；JSON 字符串里的换行已转义，按行首加缩进是安全的
+    return encoder.encode(q).replace("\n", "\n  ")
 
-def write_js(js_path: Path, q_list: List[Dict[str, Any]]):
+def iter_js_chunks(questions, var_name: str = DEFAULT_VAR_NAME) -> Iterator[str]:
+    """
+    逐题编码 window.<var_name> = [...];，结果与 json.dumps(整个列表, indent=2) 逐字节一致。
+    首块为变量头，之后每题一块（分隔符 + 题目），最后一块为结尾；题库索引依赖这一分块方式计算偏移。
+    """
+    encoder = js_item_encoder()
+    yield f"window.{var_name} = ["
+    sep = "\n  "
+    for q in questions:
+        yield sep + encode_js_item(encoder, q)
+        sep = ",\n  "
+    yield ("]" if sep == "\n  " else "\n]") + ";\n"
+
+def write_js(js_path: Path, q_list, var_name: str = DEFAULT_VAR_NAME):
+    write_chunks(js_path, iter_js_chunks(q_list, var_name))
+    return [js_path]
+
+def escape_single_quoted(text: str) -> str:
+    """按 JS 单引号字符串转义（反斜杠、单引号，以及 JS 旧引擎视为换行的 U+2028/U+2029）"""
+    return (text.replace("\\", "\\\\").replace("'", "\\'")
+            .replace("\u2028", "\\u2028").replace("\u2029", "\\u2029"))
+
+def json_parse_literal(value: Any) -> str:
+    """
+    把数据写成 JSON.parse('…') 表达式：JS 引擎解析 JSON 字符串远快于解析等价的对象字面量。
+    先输出紧凑 JSON，再按单引号字符串转义。
+    """
+    text = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=question_json)
+    return "JSON.parse('" + escape_single_quoted(text) + "')"
+
+def iter_json_parse_chunks(questions, var_name: str = DEFAULT_VAR_NAME) -> Iterator[str]:
+    """逐题编码的 json_parse_literal(题目列表)；转义逐字符进行，分段转义与整体转义结果相同"""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=question_json)
+    yield f"window.{var_name} = JSON.parse('["
+    sep = ""
+    for q in questions:
+        yield sep + escape_single_quoted(encoder.encode(q))
+        sep = ","
+    yield "]');\n"
+
+# ---- 列式输出（紧凑格式） ----
+# 题型代码，用于分片文件名等需要 ASCII 的场合
+TYPE_CODES = {"单选": "s", "多选": "m", "判断": "j"}
+COLUMN_KEYS = ("number", "type", "question", "options", "answer")
+BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def code_column(values: List[int]):
+    """小整数列：全部小于 36 时拼成 base36 单字符字符串，否则（超过 35 个选项或题型）退回整数数组"""
+    if all(v < len(BASE36) for v in values):
+        return "".join(BASE36[v] for v in values)
+    return values
+
+def column_code(col, i: int) -> int:
+    """code_column 的逆变换：取第 i 个值"""
+    v = col[i]
+    return int(v, 36) if isinstance(v, str) else v
+
+def encode_columns(q_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    把题目列表编码为列式结构（前端 decodeColumns 还原），去掉每题重复的键名与标签：
+    - types/t：题型字典 + 每题一个字符的题型下标（见 code_column）；
+    - n0 或 n：题号连续时只存起始值，否则存数组；
+    - q：题干数组；
+    - oc：每题选项数（同 t，base36 单字符拼成字符串），o：所有选项文本按顺序展平，
+      出现 3 次及以上的选项文本（如“正确/错误”）收进 od 字典，o 中以下标引用；
+    - a：答案位掩码（A=1, B=2, C=4…）；
+    - 无法按上述规则表示的题（选项标签不是 A、B、C… 顺序、答案不是有序字母、带有其他字段）
+      原样记录在 lx / ax / x 例外表中，保证解码后与原列表一致。
+    """
+    types: List[str] = []
+    type_idx: Dict[str, int] = {}
+    t_codes = []
+    numbers = []
+    stems = []
+    counts = []
+    flat_opts: List[str] = []
+    masks = []
+    label_exc: Dict[str, Any] = {}
+    answer_exc: Dict[str, List[str]] = {}
+    extra_exc: Dict[str, Dict[str, Any]] = {}
+    for i, q in enumerate(q_list):
+        q_type = q.get("type", "单选")
+        if q_type not in type_idx:
+            type_idx[q_type] = len(types)
+            types.append(q_type)
+        t_codes.append(type_idx[q_type])
+        numbers.append(q.get("number", 0))
+        stems.append(q.get("question", ""))
+
+        opts = option_pairs(q)
+        counts.append(len(opts))
+        labels = [label for label, _ in opts]
+        if "".join(labels) != "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:len(opts)]:
+            # 标签都是单字符时压成字符串，否则保留数组
+            label_exc[str(i)] = "".join(labels) if all(len(l) == 1 for l in labels) else labels
+        flat_opts.extend(text for _, text in opts)
+
+        ans = list(q.get("answer", []))
+        mask = 0
+        if all(len(a) == 1 and "A" <= a <= "Z" for a in ans) and ans == sorted(set(ans)):
+            for a in ans:
+                mask |= 1 << (ord(a) - 65)
+        else:
+            answer_exc[str(i)] = ans
+        masks.append(mask)
+
+        if isinstance(q, Question):
+            extra = {k: v for k, v in q.to_dict().items() if k not in COLUMN_KEYS} if q.images or q.explanation else {}
+        else:
+            extra = {k: v for k, v in q.items() if k not in COLUMN_KEYS}
+        if option_images(q):
+            # 图片选项：整组选项原样放进例外表，解码时覆盖按列还原的选项
+            extra["options"] = q.get("options")
+        if extra:
+            extra_exc[str(i)] = extra
+
+    freq: Dict[str, int] = {}
+    for text in flat_opts:
+        freq[text] = freq.get(text, 0) + 1
+    od = [text for text, c in freq.items() if c >= 3]
+    od_idx = {text: k for k, text in enumerate(od)}
+
+    cols: Dict[str, Any] = {"format": "columnar", "types": types, "t": code_column(t_codes)}
+    if numbers and numbers == list(range(numbers[0], numbers[0] + len(numbers))):
+        cols["n0"] = numbers[0]
+    else:
+        cols["n"] = numbers
+    cols["q"] = stems
+    cols["oc"] = code_column(counts)
+    cols["od"] = od
+    cols["o"] = [od_idx.get(text, text) for text in flat_opts]
+    cols["a"] = masks
+    if label_exc:
+        cols["lx"] = label_exc
+    if answer_exc:
+        cols["ax"] = answer_exc
+    if extra_exc:
+        cols["x"] = extra_exc
+    return cols
+
+def decode_columns(c: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """encode_columns 的逆变换（与主程序.html 的 decodeColumns 对应），字段按原输出顺序排列"""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    lx, ax, x = c.get("lx", {}), c.get("ax", {}), c.get("x", {})
+    od, flat = c["od"], c["o"]
+    out = []
+    o = 0
+    for i in range(len(c["t"])):
+        count = column_code(c["oc"], i)
+        labels = lx.get(str(i), letters)
+        options = []
+        for k in range(count):
+            text = flat[o]
+            o += 1
+            options.append({"label": labels[k], "text": od[text] if isinstance(text, int) else text})
+        answer = ax.get(str(i))
+        if answer is None:
+            mask = c["a"][i]
+            answer = [letters[b] for b in range(mask.bit_length()) if mask >> b & 1]
+        item = {
+            "options": options,
+            "answer": answer,
+            "type": c["types"][column_code(c["t"], i)],
+            "question": c["q"][i],
+            "number": c["n"][i] if "n" in c else c["n0"] + i,
+        }
+        item.update(x.get(str(i), {}))
+        out.append(item)
+    return out
+
+def iter_columnar_chunks(questions, var_name: str = DEFAULT_VAR_NAME) -> Iterator[str]:
+    # 列式编码要统计全部选项文本的出现次数，只能先收集全部题目
+    yield f"window.{var_name} = " + json.dumps(encode_columns(list(questions)), ensure_ascii=False, separators=(",", ":")) + ";\n"
+
+# ---- 分片输出（前端按需加载） ----
+
+def write_sharded(js_path: Path, q_list, shard_size: int, fmt: str = "js", var_name: str = DEFAULT_VAR_NAME) -> List[Path]:
+    """
+    分片输出：js_path 只写一个很小的清单 window.<var_name> = {"format": "sharded", ...}，
+    题目按顺序每 shard_size 题分为一个区间，区间内再按题型拆成分片文件
+    （<stem>.r0000-s.js 等，与清单同目录）。清单记录每个区间的题号范围、在整体中的起始下标和分片列表，
+    前端据此只加载当前练习需要的分片，其余在空闲时预取。
+    分片文件调用 window.questionsShardLoaded(文件名, {"pos": [区间内位置...], "questions": [...]})，
+    fmt 为 columnar 时 questions 为列式结构，为 json-parse 时整个载荷写成 JSON.parse('…')。
+    q_list 可以是任意可迭代对象，每次只取出一个区间的题目。
+    """
     js_path.parent.mkdir(parents=True, exist_ok=True)
-    js = json.dumps(q_list, ensure_ascii=False, indent=2)
-    js_text = "window.questionsData = " + js + ";\n"
-    js_path.write_text(js_text, encoding="utf-8")
+    stem = js_path.name[:-3] if js_path.name.endswith(".js") else js_path.name
+    written = []
+    ranges = []
+    it = iter(q_list)
+    start = 0
+    last_number = 0
+    for r in itertools.count():
+        chunk = list(itertools.islice(it, shard_size))
+        if not chunk:
+            break
+        by_type: Dict[str, List[Any]] = {}
+        for pos, q in enumerate(chunk):
+            by_type.setdefault(q.get("type", "单选"), []).append(pos)
+        shards = []
+        for q_type, positions in by_type.items():
+            name = f"{stem}.r{r:04d}-{TYPE_CODES.get(q_type, 'x')}.js"
+            shard_list = [chunk[i] for i in positions]
+            payload = {"pos": positions, "questions": encode_columns(shard_list) if fmt == "columnar" else shard_list}
+            if fmt == "json-parse":
+                payload_js = json_parse_literal(payload)
+            else:
+                payload_js = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=question_json)
+            text = "window.questionsShardLoaded(" + json.dumps(name) + ", " + payload_js + ");\n"
+            write_chunks(js_path.parent / name, [text])
+            written.append(js_path.parent / name)
+            shards.append({"file": name, "type": q_type, "count": len(positions)})
+        numbers = [q.get("number", 0) for q in chunk]
+        ranges.append({"from": min(numbers), "to": max(numbers), "start": start, "count": len(chunk), "shards": shards})
+        start += len(chunk)
+        last_number = numbers[-1]
+
+    # 清理上次构建遗留、本次不再使用的分片
+    keep = {p.name for p in written}
+    for old in js_path.parent.glob(f"{glob.escape(stem)}.r[0-9][0-9][0-9][0-9]-*.js"):
+        if old.name not in keep:
+            old.unlink()
+            remove_sidecars([old])
+
+    manifest = {
+        "format": "sharded",
+        "total": start,
+        "lastNumber": last_number,
+        "ranges": ranges,
+    }
+    write_chunks(js_path, [f"window.{var_name} = " + json.dumps(manifest, ensure_ascii=False, indent=2) + ";\n"])
+    return [js_path] + written
+
+def iter_ndjson_chunks(questions, var_name: str = DEFAULT_VAR_NAME) -> Iterator[str]:
+    """每行一道题的紧凑 JSON（NDJSON），供管道中的其他工具逐行处理；不使用 var_name"""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=question_json)
+    for q in questions:
+        yield encoder.encode(q) + "\n"
+
+def read_ndjson(lines) -> Iterator[Dict[str, Any]]:
+    """逐行读取 NDJSON 题目（空行跳过）；格式不对时抛出 ValueError 并指明行号"""
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"NDJSON 第 {lineno} 行不是合法 JSON：{e}") from None
+        if not isinstance(item, dict):
+            raise ValueError(f"NDJSON 第 {lineno} 行不是题目对象")
+        yield item
+
+OUTPUT_FORMATS = ("js", "columnar", "json-parse", "ndjson")
+FORMAT_CHUNKS = {"js": iter_js_chunks, "columnar": iter_columnar_chunks, "json-parse": iter_json_parse_chunks, "ndjson": iter_ndjson_chunks}
+
+def write_bank(questions, target, format: str = "js", var_name: str = DEFAULT_VAR_NAME, shard_size: int = 0) -> List[Path]:
+    """
+    库接口：逐题消费 questions（Question 或同结构的字典，可以是 iter_questions 的生成器）写出题库。
+    target 为输出路径或可写文本文件对象；返回写出的文件（写入文件对象时为空列表）。
+    js / json-parse / ndjson 边读边写，不保留已写出的题目；columnar 需要全局统计，会先收集全部题目；
+    shard_size > 0 时按区间逐块写出清单 + 分片（target 必须是路径，不支持 ndjson）。
+    """
+    if format not in FORMAT_CHUNKS:
+        raise ValueError(f"未知的输出格式：{format}（可选：{'、'.join(OUTPUT_FORMATS)}）")
+    if shard_size > 0 and format == "ndjson":
+        raise ValueError("ndjson 格式不支持分片输出")
+    if not RE_JS_IDENT.match(var_name):
+        raise ValueError(f"var_name 不是合法的 JS 标识符：{var_name}")
+    if hasattr(target, "write"):
+        if shard_size > 0:
+            raise ValueError("分片输出需要目标路径")
+        write_chunks(target, FORMAT_CHUNKS[format](questions, var_name))
+        return []
+    js_path = Path(target)
+    if shard_size > 0:
+        return write_sharded(js_path, questions, shard_size, fmt=format, var_name=var_name)
+    write_chunks(js_path, FORMAT_CHUNKS[format](questions, var_name))
+    return [js_path]
+
+def write_output(js_path: Path, q_list, shard_size: int = 0, fmt: str = "js", var_name: str = DEFAULT_VAR_NAME, precompress: bool = False,
+                 explain_shard_size: int = 0) -> List[Path]:
+    """
+    按输出参数写出题库：默认单个 JS，shard_size > 0 时为清单 + 分片；fmt 选择题目的编码格式。返回写出的文件。
+    explain_shard_size > 0 时题目的解析不写进题库，另写为解析清单 + 分片（见 write_explanations）；
+    否则删除旁边旧的解析文件，免得页面把旧解析显示在新题库的同号题目下。
+    """
+    if explain_shard_size > 0:
+        explanations: Dict[int, str] = {}
+        questions = strip_explanations(q_list, explanations)
+        if shard_size > 0:
+            # 分片是逐个替换的：先取完解析，题号冲突在写出任何分片之前报错，不留下新旧混杂的分片与解析
+            questions = list(questions)
+        paths = write_bank(questions, js_path, format=fmt, var_name=var_name, shard_size=shard_size)
+        paths += write_explanations(js_path, explanations, explain_shard_size)
+    else:
+        paths = write_bank(q_list, js_path, format=fmt, var_name=var_name, shard_size=shard_size)
+        write_explanations(js_path, {})
+    update_sidecars(paths, precompress)
+    return paths
+
+def update_sidecars(paths: List[Path], precompress: bool):
+    if precompress:
+        precompress_files(paths)
+    else:
+        # 旧的预压缩文件已与新内容不符，不能留给静态服务器
+        remove_sidecars(paths)
+
+# ---- 解析（--explanations） ----
+# 解析往往比题目本身还长，不放进启动时加载的题库：按题号每 explain_shard_size 个号段一个分片，
+# 主程序.html 在提交答案后才加载该题所在的分片。
+EXPLAIN_SHARD_SIZE = 200
+EXPLAIN_INDEX_HEAD = "window.questionsExplain = "
+RE_EXPLAIN_SHARD = re.compile(r'^window\.questionsExplainLoaded\(("(?:[^"\\]|\\.)*"), (.*)\);\s*$', re.S)
+
+class ExplanationNumberError(ValueError):
+    """带解析的题与其他题题号相同：解析按题号对应，写出后会被覆盖或显示在别的题下"""
+
+def explain_stem(js_path: Path) -> str:
+    return (js_path.name[:-3] if js_path.name.endswith(".js") else js_path.name) + ".explain"
+
+def explain_index_path(js_path: Path) -> Path:
+    """解析清单：questions_data.js -> questions_data.explain.js"""
+    return js_path.with_name(explain_stem(js_path) + ".js")
+
+def pop_explanation(q: Any) -> str:
+    if isinstance(q, Question):
+        text, q.explanation = q.explanation, ""
+        return text
+    return q.pop("explanation", "") or ""
+
+def strip_explanations(questions, out: Dict[int, str], taken=()) -> Iterator[Any]:
+    """
+    逐题取下解析记入 out（题号 -> 解析）后照常产出题目，不打断流式写出。
+    out 可以预先放入现有题库的解析，taken 为现有题库的题号（原地追加时不读旧题）；
+    题号已有解析、或带解析的题与前面的题（含 taken）同号时抛出 ExplanationNumberError，不覆盖已有解析。
+    """
+    seen = set()
+    for q in questions:
+        number = q.get("number", 0)
+        text = pop_explanation(q)
+        if number in out or (text and (number in seen or number in taken)):
+            raise ExplanationNumberError(f"题号 {number} 重复，解析按题号对应，会覆盖或错配已有解析；请加 --renumber-after-merge 或修正题号")
+        seen.add(number)
+        if text:
+            out[number] = text
+        yield q
+
+def write_explanations(js_path: Path, explanations: Dict[int, str], shard_size: int = EXPLAIN_SHARD_SIZE) -> List[Path]:
+    """
+    解析按题号分片写在题库旁：<stem>.explain.0000.js 等调用 window.questionsExplainLoaded(文件名, {"题号": "解析", ...})，
+    清单 <stem>.explain.js 为 window.questionsExplain = {"size": 每片号段长度, "files": {"片号": 文件名}}。
+    没有解析时删除清单与分片（页面加载清单失败即视为没有解析）。
+    """
+    stem = explain_stem(js_path)
+    index = explain_index_path(js_path)
+    shards: Dict[int, Dict[str, str]] = {}
+    for number in sorted(explanations):
+        shards.setdefault(number // shard_size, {})[str(number)] = explanations[number]
+    written = []
+    for k, payload in shards.items():
+        name = f"{stem}.{k:04d}.js"
+        text = "window.questionsExplainLoaded(" + json.dumps(name) + ", " + json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + ");\n"
+        write_chunks(js_path.parent / name, [text])
+        written.append(js_path.parent / name)
+    keep = {p.name for p in written}
+    for old in js_path.parent.glob(f"{glob.escape(stem)}.[0-9][0-9][0-9][0-9].js"):
+        if old.name not in keep:
+            old.unlink()
+            remove_sidecars([old])
+    if not written:
+        if index.exists():
+            index.unlink()
+            remove_sidecars([index])
+        return []
+    manifest = {"size": shard_size, "files": {str(k): f"{stem}.{k:04d}.js" for k in shards}}
+    write_chunks(index, [EXPLAIN_INDEX_HEAD + json.dumps(manifest, ensure_ascii=False) + ";\n"])
+    return [index] + written
+
+def has_explanations(js_path: Path) -> bool:
+    return explain_index_path(js_path).is_file()
+
+def read_explanations(js_path: Path) -> Dict[int, str]:
+    """读回题库旁已有的解析（--append-to 合并时用）；没有解析清单时为空"""
+    index = explain_index_path(js_path)
+    if not index.is_file():
+        return {}
+    try:
+        text = index.read_text(encoding="utf-8")
+        if not text.startswith(EXPLAIN_INDEX_HEAD):
+            raise ValueError("不是解析清单")
+        manifest = json.loads(text[len(EXPLAIN_INDEX_HEAD):].rstrip().rstrip(";"))
+        out: Dict[int, str] = {}
+        for name in manifest["files"].values():
+            m = RE_EXPLAIN_SHARD.match((js_path.parent / name).read_text(encoding="utf-8"))
+            if m is None:
+                raise ValueError(f"无法识别的解析分片：{name}")
+            out.update((int(n), text) for n, text in json.loads(m.group(2)).items())
+        return out
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise BankFormatError(f"{index.name}：{e}") from None
+
+def attach_explanations(questions: List[Any], explanations: Dict[int, str]):
+    """把已有解析按题号放回题目，合并、重新编号后再随题目一起拆出"""
+    if not explanations:
+        return
+    for q in questions:
+        text = explanations.get(q.get("number", 0))
+        if text:
+            q["explanation"] = text
+
+# ---- 题库查重（--dedupe） ----
+# 指纹只看归一化后的内容：题干（NFKC 把全角字母数字与标点转成半角，再统一常见中文标点、去掉空白），
+# 排序后的选项文本，以及答案对应的选项文本——选项顺序或编号不同的同一道题指纹相同。
+DEDUPE_POLICIES = ("off", "report", "keep-first", "keep-last")
+PUNCT_FOLD = str.maketrans({"。": ".", "、": ",", "“": '"', "”": '"', "‘": "'", "’": "'", "【": "[", "】": "]",
+                            "《": "<", "》": ">", "〈": "<", "〉": ">", "—": "-", "…": "..."})
+DUPLICATES_SHOWN = 20
+
+def normalize_text(s: str) -> str:
+    return "".join(unicodedata.normalize("NFKC", s or "").translate(PUNCT_FOLD).split()).casefold()
+
+def question_fingerprint(q: Any) -> str:
+    """题目内容指纹（不含题号与题型），用于跨文件查重与题库索引"""
+    texts = {label: normalize_text(text) for label, text in option_pairs(q)}
+    answer = sorted(texts.get(a, a) for a in (q.get("answer") or []))
+    parts = [normalize_text(q.get("question", "")), "\x1e".join(sorted(texts.values())), "\x1e".join(answer)]
+    images = list(q.get("images") or ())
+    images += sorted(posixpath.basename(i) for refs in option_images(q).values() for i in refs)
+    if images:
+        # 题干相同、插图不同（“如下图所示…”“下列哪个接线图正确”）的不算重复；只取文件名（内容哈希），与引用路径前缀无关
+        parts.append("\x1e".join(posixpath.basename(i) for i in images))
+    raw = "\x1f".join(parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def bank_fingerprints(js_path: Path) -> List[str]:
+    """题库中每题的指纹；有有效索引（<题库>.idx.json）时直接取用，不必解析整个题库"""
+    var_name = bank_var_name(js_path)
+    idx = load_index(js_path, var_name) if var_name else None
+    if idx is not None:
+        return idx["hashes"]
+    _, items = read_bank(js_path)
+    return [question_fingerprint(q) for q in items]
+
+def find_duplicates(groups: List[Tuple[str, List[str]]], policy: str, seen: Optional[Dict[str, Tuple[str, int]]] = None) -> Tuple[List[List[bool]], List[Tuple[str, int, str, int]]]:
+    """
+    groups 为按先后顺序排列的 (来源, 指纹列表)，seen 为只读参考题库的 {指纹: (来源, 第几题)}。
+    返回每组的保留标记与重复列表 [(来源, 第几题, 与之相同的来源, 第几题)]：
+    keep-first 保留最先出现的一份；keep-last 保留 groups 中最后出现的一份；report 全部保留、只记录。
+    参考题库只读，其中已有的题在 keep-first / keep-last 下都不再保留。
+    """
+    seen = dict(seen or {})
+    last: Dict[str, Tuple[str, int]] = {}
+    if policy == "keep-last":
+        for source, fps in groups:
+            for i, fp in enumerate(fps, 1):
+                if fp not in seen:
+                    last[fp] = (source, i)
+    keeps: List[List[bool]] = []
+    dups: List[Tuple[str, int, str, int]] = []
+    for source, fps in groups:
+        keep = []
+        for i, fp in enumerate(fps, 1):
+            if policy == "keep-last":
+                other = seen.get(fp) or last[fp]
+                dup = other != (source, i)
+            else:
+                other = seen.setdefault(fp, (source, i))
+                dup = other != (source, i)
+            if dup:
+                dups.append((source, i) + other)
+            keep.append(not dup or policy == "report")
+        keeps.append(keep)
+    return keeps, dups
+
+def reference_fingerprints(args, exclude: List[Path]) -> Dict[str, Tuple[str, int]]:
+    """--dedupe-against 的题库（跳过正在写入的题库本身）；无法读取时报错退出（退出码 4）"""
+    skip = {p.resolve() for p in exclude}
+    seen: Dict[str, Tuple[str, int]] = {}
+    for spec in args.dedupe_against or []:
+        path = Path(spec)
+        if path.resolve() in skip:
+            continue
+        try:
+            fps = bank_fingerprints(path)
+        except (OSError, BankFormatError) as e:
+            print(f"无法读取查重题库：{e}", file=sys.stderr)
+            sys.exit(4)
+        for i, fp in enumerate(fps, 1):
+            seen.setdefault(fp, (path.name, i))
+    return seen
+
+def dedupe_note(dups: List[Tuple[str, int, str, int]], policy: str) -> str:
+    """把重复明细打印到 stderr（最多 DUPLICATES_SHOWN 条），返回摘要"""
+    if not dups:
+        return ""
+    for source, i, other, j in dups[:DUPLICATES_SHOWN]:
+        print(f"  重复：{source} 第 {i} 题 = {other} 第 {j} 题", file=sys.stderr)
+    if len(dups) > DUPLICATES_SHOWN:
+        print(f"  …… 另有 {len(dups) - DUPLICATES_SHOWN} 处重复", file=sys.stderr)
+    return f"{len(dups)} 题内容重复（未去除）" if policy == "report" else f"去除重复 {len(dups)} 题"
+
+def dedupe_policy(args) -> str:
+    """未指定 --dedupe 时：--append-to / --dedupe-against 默认 report，其余不查重"""
+    if args.dedupe is not None:
+        return args.dedupe
+    return "report" if args.append_to or args.dedupe_against else "off"
+
+def dedupe_new(args, q_list: List[Any], exclude: List[Path]) -> Tuple[List[Any], str]:
+    """不合并现有题库时的查重：新题内部及与 --dedupe-against 题库之间；删除后按 --start-number 重新编号（题号来自 Word 或 NDJSON 时不改）"""
+    policy = dedupe_policy(args)
+    if policy == "off":
+        return q_list, ""
+    seen = reference_fingerprints(args, exclude)
+    (keep,), dups = find_duplicates([("新题", [question_fingerprint(q) for q in q_list])], policy, seen)
+    kept = [q for q, k in zip(q_list, keep) if k]
+    if len(kept) != len(q_list) and not (args.respect_number or args.from_ndjson):
+        for n, q in enumerate(kept, args.start_number):
+            q["number"] = n
+    return kept, dedupe_note(dups, policy)
+
+# ---- 近似重复（--near-dupes，MinHash + LSH） ----
+# 每题取归一化后的题干与选项文本的 3 字片段（shingle），用 128 个乘移位哈希 ((a·x + b) mod 2^64) >> 32 求 MinHash 签名；
+# 签名分成 32 段、每段 4 行，任一段完全相同的两题才成为候选，再按签名估计的相似度（Jaccard）过滤，
+# 不必对十万题两两比较。装了 numpy 时签名与分段按矩阵计算，否则逐题用纯 Python 计算（结果相同，只是慢）。
+MINHASH_PERMS = 128
+LSH_ROWS = 4
+SHINGLE_SIZE = 3
+NEAR_THRESHOLD = 0.8
+MASK64 = (1 << 64) - 1
+MINHASH_CHUNK = 1 << 16  # numpy 每批处理的片段数：中间矩阵为 128 × 65536 × 8 字节 = 64 MB
+
+def load_numpy():
+    """导入 numpy 并返回；未安装时返回 False（之后不再尝试）"""
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except Exception:
+            np = False
+    return np
+
+def minhash_params() -> Tuple[List[int], List[int]]:
+    rng = random.Random(20240601)  # 固定种子：同一道题每次运行的签名相同
+    return [rng.getrandbits(64) | 1 for _ in range(MINHASH_PERMS)], [rng.getrandbits(64) for _ in range(MINHASH_PERMS)]
+
+def question_shingles(q: Any) -> List[int]:
+    """题干与排序后的选项文本的字片段哈希（crc32，跨进程稳定）"""
+    text = "\x1f".join([normalize_text(q.get("question", ""))] + sorted(normalize_text(t) for _, t in option_pairs(q)))
+    if len(text) <= SHINGLE_SIZE:
+        grams = {text} if text else set()
+    else:
+        grams = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return [zlib.crc32(g.encode("utf-8")) for g in grams]
+
+def minhash_python(shingles: List[List[int]]) -> List[Tuple[int, ...]]:
+    a, b = minhash_params()
+    return [tuple(min((ai * x + bi) & MASK64 for x in xs) >> 32 for ai, bi in zip(a, b)) for xs in shingles]
+
+def minhash_numpy(shingles: List[List[int]]):
+    """(题数, MINHASH_PERMS) 的 uint32 签名矩阵；按题分批，每批对所有哈希函数一次算完再按题取最小值（uint64 乘法自然按 2^64 回绕）"""
+    a, b = (np.array(v, dtype=np.uint64)[:, None] for v in minhash_params())
+    lengths = np.fromiter(map(len, shingles), dtype=np.int64, count=len(shingles))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    flat = np.fromiter(itertools.chain.from_iterable(shingles), dtype=np.uint64, count=int(ends[-1]) if len(ends) else 0)
+    sigs = np.empty((len(shingles), MINHASH_PERMS), dtype=np.uint32)
+    lo = 0
+    while lo < len(shingles):
+        hi = max(int(np.searchsorted(ends, starts[lo] + MINHASH_CHUNK, side="right")), lo + 1)
+        h = a * flat[starts[lo]:ends[hi - 1]] + b
+        sigs[lo:hi] = (np.minimum.reduceat(h, starts[lo:hi] - starts[lo], axis=1) >> np.uint64(32)).T
+        lo = hi
+    return sigs
+
+def signature_similarity_python(x: Tuple[int, ...], y: Tuple[int, ...]) -> float:
+    return sum(u == v for u, v in zip(x, y)) / MINHASH_PERMS
+
+def lsh_candidates_python(sigs: List[Tuple[int, ...]]) -> List[Tuple[int, int, float]]:
+    """每段签名相同的题落入同一个桶，桶内每题与桶内第一题配对（相似度可传递，不必两两配对）"""
+    pairs = set()
+    for k in range(0, MINHASH_PERMS, LSH_ROWS):
+        leaders: Dict[Tuple[int, ...], int] = {}
+        for i, sig in enumerate(sigs):
+            first = leaders.setdefault(sig[k:k + LSH_ROWS], i)
+            if first != i:
+                pairs.add((first, i))
+    return [(i, j, signature_similarity_python(sigs[i], sigs[j])) for i, j in sorted(pairs)]
+
+def lsh_candidates_numpy(sigs) -> List[Tuple[int, int, float]]:
+    n = len(sigs)
+    found = []
+    for k in range(0, MINHASH_PERMS, LSH_ROWS):
+        band = np.ascontiguousarray(sigs[:, k:k + LSH_ROWS]).view(np.dtype((np.void, 4 * LSH_ROWS))).ravel()
+        _, first, inverse = np.unique(band, return_index=True, return_inverse=True)
+        leader = first[inverse.ravel()]
+        rows = np.flatnonzero(leader != np.arange(n))
+        found.append(leader[rows] * n + rows)
+    codes = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+    out = []
+    for lo in range(0, len(codes), MINHASH_CHUNK):
+        i, j = np.divmod(codes[lo:lo + MINHASH_CHUNK], n)
+        scores = (sigs[i] == sigs[j]).mean(axis=1)
+        out.extend(zip(i.tolist(), j.tolist(), scores.tolist()))
+    return out
+
+def near_duplicate_clusters(questions: List[Any], threshold: float = NEAR_THRESHOLD) -> List[List[Tuple[int, float]]]:
+    """
+    近似重复的题目分组：返回 [[(题目下标, 与组内第一题的相似度), …], …]，组内按下标排列、组按第一题下标排列。
+    相似度为 MinHash 估计的 Jaccard 系数（0~1）。达到 threshold 的候选对先连成连通块，
+    块内再以最靠前的未分组题为组首，只收与组首相似度达到 threshold 的题，其余留给下一组，
+    避免 A≈B≈C 链式相连时把与组首并不相似的 C 也报进同一组。
+    """
+    shingles = [question_shingles(q) for q in questions]
+    present = [i for i, xs in enumerate(shingles) if xs]
+    shingles = [shingles[i] for i in present]
+    if load_numpy():
+        sigs = minhash_numpy(shingles)
+        candidates = lsh_candidates_numpy(sigs)
+        similarities = lambda i, js: (sigs[js] == sigs[i]).mean(axis=1).tolist()
+    else:
+        sigs = minhash_python(shingles)
+        candidates = lsh_candidates_python(sigs)
+        similarities = lambda i, js: [signature_similarity_python(sigs[i], sigs[j]) for j in js]
+
+    parent = list(range(len(shingles)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, score in candidates:
+        if score >= threshold:
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+    components: Dict[int, List[int]] = {}
+    for i in range(len(shingles)):
+        components.setdefault(find(i), []).append(i)
+    clusters = []
+    for rest in components.values():
+        while len(rest) > 1:
+            leader, others = rest[0], rest[1:]
+            scores = similarities(leader, others)
+            members = [(j, score) for j, score in zip(others, scores) if score >= threshold]
+            if members:
+                clusters.append([(present[leader], 1.0)] + [(present[j], score) for j, score in members])
+            rest = [j for j, score in zip(others, scores) if score < threshold]
+    clusters.sort()
+    return clusters
+
+def near_dupes_note(args, questions: List[Any]) -> str:
+    """--near-dupes：把近似重复分组写成 JSON 报告（题目位置、题号、题干与相似度），返回摘要"""
+    if not args.near_dupes:
+        return ""
+    clusters = near_duplicate_clusters(questions, args.near_threshold)
+    report = {"threshold": args.near_threshold, "total": len(questions), "clusters": [
+        [{"position": i + 1, "number": questions[i].get("number"), "type": questions[i].get("type"),
+          "question": questions[i].get("question"), "similarity": round(score, 3)} for i, score in members]
+        for members in clusters]}
+    write_chunks(Path(args.near_dupes), [json.dumps(report, ensure_ascii=False, indent=2), "\n"])
+    return f"近似重复 {len(clusters)} 组（{sum(map(len, clusters))} 题），见 {args.near_dupes}"
+
+# ---- 题库索引（--append-to 只写新增部分） ----
+# <题库>.idx.json 记录 js 格式题库的题目指纹（question_fingerprint）、题号情况与字节偏移；
+# 文件大小、修改时间与结尾字节都对得上时，追加新题只需截掉结尾、写入新题和新结尾。
+INDEX_VERSION = 2  # 2：hashes 改为 question_fingerprint
+
+def index_path(js_path: Path) -> Path:
+    return js_path.with_name(js_path.name + ".idx.json")
+
+def encode_output(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return data.replace(b"\n", OUTPUT_NEWLINE) if OUTPUT_NEWLINE != b"\n" else data
+
+def js_tail(count: int) -> bytes:
+    """iter_js_chunks 的结尾块：空数组为 "];"，否则 "\n];" """
+    return encode_output("];\n" if count == 0 else "\n];\n")
+
+def new_index(var_name: str) -> Dict[str, Any]:
+    return {"version": INDEX_VERSION, "var_name": var_name, "count": 0, "first_number": None, "last_number": None,
+            "max_number": None, "contiguous": True, "tail_offset": 0, "offsets": [], "hashes": []}
+
+def index_add(idx: Dict[str, Any], q: Any, offset: int):
+    number = q.get("number", 0)
+    if idx["count"] == 0:
+        idx["first_number"] = idx["max_number"] = number
+    else:
+        idx["contiguous"] = idx["contiguous"] and number == idx["last_number"] + 1
+        idx["max_number"] = max(idx["max_number"], number)
+    idx["last_number"] = number
+    idx["count"] += 1
+    idx["offsets"].append(offset)
+    idx["hashes"].append(question_fingerprint(q))
+
+def save_index(js_path: Path, idx: Dict[str, Any]):
+    st = js_path.stat()
+    idx["size"], idx["mtime_ns"] = st.st_size, st.st_mtime_ns
+    write_chunks(index_path(js_path), [json.dumps(idx, ensure_ascii=False, separators=(",", ":"))])
+
+def load_index(js_path: Path, var_name: str) -> Optional[Dict[str, Any]]:
+    """读取并校验索引；题库在索引之后被改动过（大小、修改时间或结尾不符）时返回 None"""
+    try:
+        idx = json.loads(index_path(js_path).read_text(encoding="utf-8"))
+        st = js_path.stat()
+    except (OSError, ValueError):
+        return None
+    if (idx.get("version") != INDEX_VERSION or idx.get("var_name") != var_name
+            or idx.get("size") != st.st_size or idx.get("mtime_ns") != st.st_mtime_ns):
+        return None
+    with open(js_path, "rb") as f:
+        f.seek(idx["tail_offset"])
+        if f.read() != js_tail(idx["count"]):
+            return None
+    return idx
+
+def write_js_indexed(js_path: Path, questions, var_name: str) -> Dict[str, Any]:
+    """与 write_js 相同的输出，同时按 iter_js_chunks 的分块记录每题偏移与哈希，写出索引"""
+    idx = new_index(var_name)
+    pending: List[Any] = []
+
+    def recorded(items):
+        for q in items:
+            pending.append(q)
+            yield q
+
+    def blocks():
+        pos = 0
+        for k, chunk in enumerate(iter_js_chunks(recorded(questions), var_name)):
+            data = encode_output(chunk)
+            if pending:
+                # 本块是一道题：跳过分隔符（首题 "\n  "，其余 ",\n  "）即为题目起点
+                sep = encode_output("\n  " if idx["count"] == 0 else ",\n  ")
+                index_add(idx, pending.pop(), pos + len(sep))
+            else:
+                idx["tail_offset"] = pos  # 最后一块为结尾
+            pos += len(data)
+            yield data
+
+    write_atomic(js_path, blocks())
+    save_index(js_path, idx)
+    return idx
+
+def append_journal_path(js_path: Path) -> Path:
+    return js_path.with_name(js_path.name + ".append.json")
+
+def recover_append(js_path: Path):
+    """
+    上次原地追加中途退出（留下了 <题库>.append.json）时，把题库截回追加前的结尾并补上原来的 "];"。
+    恢复后文件的大小与修改时间都与索引不符，下次追加会完整读取并重建索引。
+    """
+    journal = append_journal_path(js_path)
+    try:
+        state = json.loads(journal.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    if js_path.is_file() and js_path.stat().st_size >= state["tail_offset"]:
+        with open(js_path, "r+b") as f:
+            f.seek(state["tail_offset"])
+            f.write(js_tail(state["count"]))
+            f.truncate()
+        print(f"⚠️ {js_path} 上次追加未完成，已恢复为追加前的内容", file=sys.stderr)
+    journal.unlink()
+
+def append_js_tail(js_path: Path, idx: Dict[str, Any], new_list: List[Any]):
+    """
+    在索引有效的题库末尾原地追加新题：从结尾处截断，写入新题与新结尾，更新索引。
+    没有新题时不动文件（修改时间不变）。改写前先记下原结尾位置（<题库>.append.json），
+    中途退出留下的半截文件由下次追加时的 recover_append 恢复。
+    """
+    if not new_list:
+        return
+    encoder = js_item_encoder()
+    parts: List[bytes] = []
+    old_tail = pos = idx["tail_offset"]
+    old_count = idx["count"]
+    for q in new_list:
+        sep = encode_output("\n  " if idx["count"] == 0 else ",\n  ")
+        data = encode_output(encode_js_item(encoder, q))
+        index_add(idx, q, pos + len(sep))
+        parts.append(sep)
+        parts.append(data)
+        pos += len(sep) + len(data)
+    idx["tail_offset"] = pos
+    parts.append(js_tail(idx["count"]))
+    journal = append_journal_path(js_path)
+    write_chunks(journal, [json.dumps({"tail_offset": old_tail, "count": old_count})])
+    with open(js_path, "r+b") as f:
+        f.seek(old_tail)
+        f.writelines(parts)
+        f.truncate()
+    save_index(js_path, idx)
+    journal.unlink()
+
+# ---- 预压缩（.gz / .br） ----
+SIDECAR_SUFFIXES = (".gz", ".br")
+
+def compress_file(path: Path) -> List[Path]:
+    """
+    以最高压缩率生成 .gz 与 .br（需安装 brotli）旁路文件，结果可逐字节复现：
+    gzip 头里的时间戳固定为 0、不写文件名，压缩参数固定；内容未变时不改写。
+    """
+    data = path.read_bytes()
+    out = [path.with_name(path.name + ".gz")]
+    write_atomic(out[0], [gzip.compress(data, compresslevel=9, mtime=0)])
+    br_path = path.with_name(path.name + ".br")
+    if brotli is not None:
+        write_atomic(br_path, [brotli.compress(data, mode=brotli.MODE_TEXT, quality=11, lgwin=22)])
+        out.append(br_path)
+    elif br_path.exists():
+        br_path.unlink()
+    return out
+
+def precompress_files(paths: List[Path]) -> List[Path]:
+    # zlib / brotli 压缩时释放 GIL，线程池即可并行
+    with ThreadPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1) or 1) as ex:
+        return [p for out in ex.map(compress_file, paths) for p in out]
+
+def remove_sidecars(paths: List[Path]):
+    for path in paths:
+        for suffix in SIDECAR_SUFFIXES:
+            sidecar = path.with_name(path.name + suffix)
+            if sidecar.exists():
+                sidecar.unlink()
+
+# ---- 转换缓存（按输入内容哈希） ----
+DEFAULT_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "word2questions"
+DEFAULT_CACHE_MAX_MB = 256
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ConversionCache:
+    """
+    磁盘缓存：键 = 输入内容哈希 + 语法版本 + 影响解析结果的参数，值 = 解析后的题目列表(JSON)。
+    命中时更新文件 mtime，写入后按 mtime 做 LRU 淘汰，总大小不超过 max_bytes。
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def key(self, content_hash: str, opts: Dict[str, Any]) -> str:
+        # stream 只影响读取方式，不影响结果，不参与缓存键
+        params = {k: v for k, v in opts.items() if k != "stream"}
+        raw = json.dumps({"grammar": GRAMMAR_VERSION, "input": content_hash, "opts": params}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def block_key(self, in_path: Path, opts: Dict[str, Any]) -> str:
+        """题块状态按输入文件位置保存（内容变了才需要它），同一文件的新版本覆盖旧版本"""
+        params = {k: v for k, v in opts.items() if k != "stream"}
+        raw = json.dumps({"grammar": GRAMMAR_VERSION, "blocks": str(Path(in_path).resolve()), "opts": params}, sort_keys=True, default=str)
+        return "blocks-" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            value = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)  # 记录最近使用时间
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key: str, value: Any):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(value, ensure_ascii=False, default=question_json), encoding="utf-8")
+            os.replace(tmp, path)
+            self.evict()
+        except OSError as e:
+            # 缓存只是加速手段，写失败不影响转换结果
+            print(f"⚠️ 写入缓存失败：{e}", file=sys.stderr)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for f in self.cache_dir.glob("*.json"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue  # 可能已被并行进程淘汰
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        entries.sort()
+        for _, size, f in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                f.unlink()
+                total -= size
+            except OSError:
+                pass
+
+def cache_from_args(args) -> Optional[ConversionCache]:
+    # 答案表模式每次都要给出未匹配报告，不走缓存
+    if args.no_cache or args.answer_key:
+        return None
+    cache_dir = Path(args.cache_dir) if args.cache_dir else DEFAULT_CACHE_DIR
+    return ConversionCache(cache_dir, args.cache_max_mb * 1024 * 1024)
+
+# ---- 题块级增量解析 ----
+def iter_blocks(lines) -> Iterator[List[str]]:
+    """按 RE_Q_START 把行切成题块：每块从一个题起始行到下一个题起始行之前（首块可能是无题号的前言）；带图片的 DocLine 原样保留"""
+    block: List[str] = []
+    for raw in lines:
+        line = raw.strip()
+        if RE_Q_START.match(line) and block:
+            yield block
+            block = []
+        block.append(DocLine(line, raw.marked, raw.images) if isinstance(raw, DocLine) else line)
+    if block:
+        yield block
+
+def block_fingerprint(block: List[str]) -> str:
+    # 图片引用也算进指纹：文字相同、换了插图的题块要重新解析；没有图片时与只含文本的指纹相同
+    text = "\n".join(line + "\x1e" + "\x1e".join(line.images) if isinstance(line, DocLine) and line.images else line for line in block)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def assets_present(q_list: List[Question], opts: Dict[str, Any]) -> bool:
+    """--asset-dir 时缓存里的题目引用的图片（题干与选项）是否都还在素材目录里；被删掉的要重新解析写出"""
+    asset_dir = opts.get("asset_dir")
+    if not asset_dir:
+        return True
+    for q in q_list:
+        refs = list(q.images)
+        for images in (q.option_images or {}).values():
+            refs.extend(images)
+        if not all((Path(asset_dir) / posixpath.basename(ref)).is_file() for ref in refs):
+            return False
+    return True
+
+def parse_docx_incremental(in_path: Path, opts: Dict[str, Any], cache: ConversionCache) -> Tuple[List[Question], Dict[str, int]]:
+    """
+    与上次解析同一文件的结果对比：只重新解析指纹变化的题块，其余直接复用上次的题目。
+    题块之间互不影响（每个题起始都会重置缓冲），唯一依赖位置的是自动题号，复用时按块序号重新赋值。
+    返回 (题目列表, {"added","changed","removed","reused"})
+    """
+    start_number = opts.get("start_number", 1)
+    respect = opts.get("respect_word_number", False)
+    key = cache.block_key(in_path, opts)
+    prev = cache.get(key) or {}
+    prev_fps = prev.get("fingerprints", [])
+    prev_blocks = dict(zip(prev_fps, prev.get("questions", [])))
+
+    questions: List[Question] = []
+    fps: List[str] = []
+    block_questions: List[Optional[Question]] = []
+    auto_num = start_number
+    reused = 0
+    # 整篇重新读取：图片随读取写入素材目录，复用的题块引用的图片也会补齐
+    lines = iter_docx_lines(in_path, stream=opts.get("stream", False), numbering=opts.get("auto_number", True), math=opts.get("math", False),
+                            asset_dir=opts.get("asset_dir"), asset_url=opts.get("asset_url", ""))
+    for block in iter_blocks(lines):
+        fp = block_fingerprint(block)
+        is_question = bool(RE_Q_START.match(block[0]))
+        if fp in prev_blocks:
+            q = prev_blocks[fp]
+            if q is not None:
+                q = Question.from_dict(q)
+                if not respect:
+                    q.number = auto_num
+            reused += 1
+        else:
+            parsed = parse_lines(block, start_number=auto_num, respect_word_number=respect, explanations=opts.get("explanations", False))
+            q = parsed[0] if parsed else None
+        if is_question:
+            auto_num = (int(RE_Q_START.match(block[0]).group("num")) if respect else auto_num) + 1
+        fps.append(fp)
+        block_questions.append(q)
+        if q is not None:
+            questions.append(q)
+
+    # 以题块指纹序列做差异对比，统计新增/修改/删除
+    report = {"added": 0, "changed": 0, "removed": 0, "reused": reused}
+    if prev_fps:
+        sm = difflib.SequenceMatcher(None, prev_fps, fps, autojunk=False)
+        for tag, i1, i2, j1, j2 in sm.get_opcodes():
+            if tag == "replace":
+                paired = min(i2 - i1, j2 - j1)
+                report["changed"] += paired
+                report["removed"] += (i2 - i1) - paired
+                report["added"] += (j2 - j1) - paired
+            elif tag == "delete":
+                report["removed"] += i2 - i1
+            elif tag == "insert":
+                report["added"] += j2 - j1
+    else:
+        report["added"] = len(fps)
+
+    cache.put(key, {"fingerprints": fps, "questions": block_questions})
+    return questions, report
+
+def parse_docx_cached(in_path: Path, opts: Dict[str, Any], cache: Optional[ConversionCache]) -> Tuple[List[Question], str]:
+    """带缓存的 parse_docx，返回 (题目列表, 说明)；说明为空表示完整解析（答案表模式下为未匹配报告）"""
+    if opts.get("answer_key"):
+        # 答案表跨越整个文档，不能按题块增量解析
+        report: Dict[str, List[Any]] = {}
+        return parse_docx(in_path, key_report=report, **opts), key_report_note(report)
+    if cache is None:
+        return parse_docx(in_path, **opts), ""
+    key = cache.key(file_sha256(in_path), opts)
+    q_list = questions_from_json(cache.get(key))
+    if q_list is not None and assets_present(q_list, opts):
+        return q_list, "缓存"
+    if opts.get("answer_format"):
+        # 格式标记不在题块指纹（只含文本）里，不能按题块增量复用
+        q_list, report = parse_docx(in_path, **opts), {"reused": 0}
+    else:
+        q_list, report = parse_docx_incremental(in_path, opts, cache)
+    cache.put(key, q_list)
+    if report["reused"]:
+        return q_list, f"增量：新增 {report['added']}，修改 {report['changed']}，删除 {report['removed']}"
+    return q_list, ""
+
+# ---- 批量转换 ----
+def resolve_inputs(spec: str) -> List[Path]:
+    """输入可以是单个文件、目录（递归查找 .docx）或通配符；结果按路径排序，保证合并顺序稳定"""
+    p = Path(spec)
+    if p.is_dir():
+        files = p.rglob("*.docx")
+    elif glob.has_magic(spec):
+        files = (Path(f) for f in glob.glob(spec, recursive=True))
+    else:
+        return [p]
+    # 跳过 Word 打开文档时生成的 ~$ 临时文件
+    return sorted(f for f in files if f.is_file() and not f.name.startswith("~$"))
+
+def convert_one(task: Tuple[Path, Optional[Path], Dict[str, Any], Optional[ConversionCache], Dict[str, Any], bool]) -> Tuple[Path, Optional[List[Question]], int, float, Optional[str], str, Optional[Dict[str, Any]]]:
+    """
+    批量模式的工作进程入口：解析一个 docx。
+    out_path 不为空时在子进程内直接写出（避免把题目列表传回主进程），否则返回题目列表用于合并。
+    profile 为真时不走缓存，记录分阶段统计。
+    返回 (输入路径, 题目列表或 None, 题数, 耗时秒, 错误信息, 缓存/增量说明, 统计或 None)
+    """
+    in_path, out_path, opts, cache, out_opts, profile = task
+    t0 = time.perf_counter()
+    stats = ConvertStats() if profile else None
+    if stats is not None:
+        tracemalloc.start()
+    try:
+        if stats is not None:
+            q_list, note = parse_docx(in_path, stats=stats, **opts), ""
+        else:
+            q_list, note = parse_docx_cached(in_path, opts, cache)
+        if out_path is not None:
+            if stats is not None:
+                with stats.stage("serialize"):
+                    write_output(out_path, q_list, **out_opts)
+            else:
+                write_output(out_path, q_list, **out_opts)
+            q_list_out = None
+        else:
+            q_list_out = q_list
+        return in_path, q_list_out, len(q_list), time.perf_counter() - t0, None, note, stats.to_dict() if stats else None
+    except Exception as e:
+        return in_path, None, 0, time.perf_counter() - t0, str(e), "", None
+    finally:
+        if stats is not None:
+            tracemalloc.stop()
+
+def profiling(args) -> bool:
+    return bool(args.profile or args.stats_json)
+
+def report_stats(stats: ConvertStats, args, files: Optional[List[Dict[str, Any]]] = None):
+    """--profile 打印到 stderr；--stats-json 写出 JSON（批量模式附带每个文件的统计）"""
+    if args.profile:
+        print_profile(stats)
+    if args.stats_json:
+        data = stats.to_dict()
+        if files is not None:
+            data["files"] = files
+        Path(args.stats_json).write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+def merge_bank(args, new_list: List[Any], policy: str, seen: Dict[str, Tuple[str, int]]) -> Tuple[List[Any], int, List[Tuple[str, int, str, int]]]:
+    """
+    读取 --append-to 的现有题库，与新题查重后合并（需要时重新编号），返回 (合并结果, 现有题数, 重复列表)。
+    现有文件无法识别时报错退出（退出码 4），而不是把旧题库覆盖掉。
+    """
+    bank = Path(args.append_to)
+    try:
+        old_list = read_bank(bank)[1] if bank.exists() else []
+    except BankFormatError as e:
+        print(f"无法读取现有题库：{e}", file=sys.stderr)
+        sys.exit(4)
+    attach_explanations(old_list, existing_explanations(bank))
+    old_count = len(old_list)
+    dups: List[Tuple[str, int, str, int]] = []
+    if policy != "off":
+        groups = [(bank.name, [question_fingerprint(q) for q in old_list]), ("新题", [question_fingerprint(q) for q in new_list])]
+        (keep_old, keep_new), dups = find_duplicates(groups, policy, seen)
+        old_list = [q for q, k in zip(old_list, keep_old) if k]
+        new_list = [q for q, k in zip(new_list, keep_new) if k]
+    merged = list(old_list) + list(new_list)
+    if args.renumber_after_merge:
+        for n, item in enumerate(merged, args.start_number):
+            item["number"] = n
+    return merged, old_count, dups
+
+def existing_explanations(bank: Path) -> Dict[int, str]:
+    """
+    读取现有题库旁的解析。没加 --explanations 也读取：合并、重新编号后随题目一起写回，不留下错号的旧解析。
+    解析文件损坏时与题库损坏一样退出（退出码 4）。
+    """
+    try:
+        return read_explanations(bank)
+    except BankFormatError as e:
+        print(f"无法读取现有解析：{e}", file=sys.stderr)
+        sys.exit(4)
+
+def write_appended(args, out_path: Path, new_list: List[Any]) -> str:
+    """
+    --append-to 的合并、查重与写出，返回附加说明。
+    js 格式追加回同一文件且索引有效时只写新增部分：查重直接用索引里的指纹，--renumber-after-merge 只给新题编号；
+    需要删除旧题（keep-last，或旧题库本身有重复）、旧题号不是从 --start-number 起连续而要整体重排、
+    --near-dupes 需要整个题库的题目内容，或没有有效索引时，读取整个旧题库合并后完整写出（js 格式同时重建索引）。
+    """
+    bank = Path(args.append_to)
+    recover_append(bank)
+    policy = dedupe_policy(args)
+    seen = reference_fingerprints(args, [bank, out_path]) if policy != "off" else {}
+    single_js = args.format == "js" and args.shard_size <= 0
+    explain = args.explanations or has_explanations(bank)
+    idx = None
+    if single_js and not args.near_dupes and bank.is_file() and out_path.resolve() == bank.resolve():
+        idx = load_index(bank, args.var_name)
+        if idx is not None and args.renumber_after_merge and idx["count"] and not (idx["contiguous"] and idx["first_number"] == args.start_number):
+            idx = None
+        if idx is not None and explain and not idx["contiguous"]:
+            idx = None  # 解析查重号需要现有题号，索引只记录连续号段
+    dups: List[Tuple[str, int, str, int]] = []
+    if idx is not None and policy != "off":
+        groups = [(bank.name, idx["hashes"]), ("新题", [question_fingerprint(q) for q in new_list])]
+        (keep_old, keep_new), dups = find_duplicates(groups, policy, seen)
+        if all(keep_old):
+            new_list = [q for q, k in zip(new_list, keep_new) if k]
+        else:
+            idx = None
+    if idx is not None:
+        old_count = idx["count"]
+        if args.renumber_after_merge:
+            for n, q in enumerate(new_list, args.start_number + old_count):
+                q["number"] = n
+        paths = [bank]
+        if explain:
+            # 快速路径不改动现有题号，已有解析原样保留，新题解析按题号并入；新题与现有题号冲突时报错，不覆盖
+            explanations = existing_explanations(bank)
+            taken = range(idx["first_number"], idx["last_number"] + 1) if idx["count"] else ()
+            new_list = list(strip_explanations(new_list, explanations, taken))
+            paths += write_explanations(bank, explanations, args.explain_shard_size)
+        append_js_tail(bank, idx, new_list)
+        update_sidecars(paths, args.precompress)
+        notes = [f"在现有 {old_count} 题后追加", dedupe_note(dups, policy)]
+    else:
+        merged, old_count, dups = merge_bank(args, new_list, policy, seen)
+        if single_js:
+            explanations: Dict[int, str] = {}
+            if explain:
+                # 现有解析已随旧题放回（merge_bank），按合并后的题号重新拆出
+                merged = list(strip_explanations(merged, explanations))
+            # 没有解析时删除输出旁旧的解析文件
+            paths = [out_path] + write_explanations(out_path, explanations, args.explain_shard_size)
+            write_js_indexed(out_path, merged, args.var_name)
+            update_sidecars(paths, args.precompress)
+        else:
+            write_output(out_path, merged, **output_options(args, explain))
+        notes = [f"合并现有 {old_count} 题" if old_count else "", dedupe_note(dups, policy), near_dupes_note(args, merged)]
+    return "，".join(n for n in notes if n)
+
+def parse_options(args, out_path: Optional[Path] = None) -> Dict[str, Any]:
+    """解析参数；out_path 为题库输出位置（默认 -o），--asset-dir 的图片引用路径相对于它所在的目录"""
+    opts = {"start_number": args.start_number, "respect_word_number": args.respect_number, "stream": args.stream, "answer_key": args.answer_key,
+            "auto_number": not args.no_auto_number, "answer_format": args.answer_format or "", "math": args.math,
+            "explanations": args.explanations}
+    if args.asset_dir:
+        asset_dir = Path(args.asset_dir)
+        opts.update(asset_dir=asset_dir, asset_url=asset_url(asset_dir, out_path or Path(args.output)))
+    return opts
+
+def output_options(args, explanations: bool = False) -> Dict[str, Any]:
+    """explanations 为真时即使没加 --explanations 也拆出解析（--append-to 的现有题库带有解析）"""
+    return {"shard_size": args.shard_size, "fmt": args.format, "var_name": args.var_name, "precompress": args.precompress,
+            "explain_shard_size": args.explain_shard_size if args.explanations or explanations else 0}
+
+def run_batch(inputs: List[Path], args) -> int:
+    out_path = Path(args.output)
+    opts = parse_options(args)
+    profile = profiling(args)
+    # 统计耗时时不走缓存，否则测到的只是缓存读取
+    cache = None if profile else cache_from_args(args)
+    out_opts = output_options(args)
+
+    if args.merge:
+        tasks = [(p, None, opts, cache, out_opts, profile) for p in inputs]
+    else:
+        if args.append_to or args.dedupe is not None or args.dedupe_against or args.near_dupes:
+            print("批量模式下 --append-to / --dedupe / --dedupe-against / --near-dupes 仅可与 --merge 一起使用", file=sys.stderr)
+            return 2
+        # 每个输入在其所在目录生成同名输出（文件名取 -o 的文件名部分）
+        targets = [p.parent / out_path.name for p in inputs]
+        if len(set(targets)) != len(targets):
+            print(f"多个输入位于同一目录，输出 {out_path.name} 会互相覆盖；请改用 --merge", file=sys.stderr)
+            return 2
+        tasks = [(p, t, parse_options(args, t) if args.asset_dir else opts, cache, out_opts, profile) for p, t in zip(inputs, targets)]
+
+    t0 = time.perf_counter()
+    results: List[Any] = [None] * len(tasks)
+    pending = []
+    for i, task in enumerate(tasks):
+        # 先在主进程查缓存：未变化的输入不必启动工作进程
+        if cache is not None:
+            in_path, target = task[0], task[1]
+            t1 = time.perf_counter()
+            try:
+                q_list = questions_from_json(cache.get(cache.key(file_sha256(in_path), task[2])))
+            except OSError:
+                q_list = None
+            if q_list is not None and assets_present(q_list, task[2]):
+                if target is not None:
+                    write_output(target, q_list, **out_opts)
+                    results[i] = (in_path, None, len(q_list), time.perf_counter() - t1, None, "缓存", None)
+                else:
+                    results[i] = (in_path, q_list, len(q_list), time.perf_counter() - t1, None, "缓存", None)
+                continue
+        pending.append(i)
+
+    jobs = min(args.jobs or os.cpu_count() or 1, max(len(pending), 1))
+    todo = [tasks[i] for i in pending]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            done = list(ex.map(convert_one, todo))
+    else:
+        done = [convert_one(t) for t in todo]
+    for i, r in zip(pending, done):
+        results[i] = r
+    elapsed = time.perf_counter() - t0
+
+    failed = 0
+    total = 0
+    merged: List[Dict[str, Any]] = []
+    width = len(str(len(results)))
+    hits = 0
+    totals = ConvertStats()
+    per_file: List[Dict[str, Any]] = []
+    for i, (in_path, q_list, count, secs, err, note, file_stats) in enumerate(results, 1):
+        if err:
+            failed += 1
+            print(f"  [{i:>{width}}/{len(results)}] ❌ {in_path}  解析失败：{err}", file=sys.stderr)
+            continue
+        total += count
+        hits += note == "缓存"
+        print(f"  [{i:>{width}}/{len(results)}] {in_path}  {count} 题  {secs:.2f}s{f'（{note}）' if note else ''}")
+        if q_list is not None:
+            merged.extend(q_list)
+        if file_stats is not None:
+            totals.merge(file_stats)
+            per_file.append(dict(file_stats, file=str(in_path)))
+
+    if args.merge:
+        append_note = ""
+        if not args.append_to:
+            merged, append_note = dedupe_new(args, merged, [out_path])
+        if not args.respect_number:
+            # 各文件独立从 --start-number 编号，合并后顺延为连续题号
+            for n, item in enumerate(merged, args.start_number):
+                item["number"] = n
+        if not args.append_to:
+            append_note = "，".join(n for n in (append_note, near_dupes_note(args, merged)) if n)
+        if profile:
+            tracemalloc.start()
+        try:
+            if args.append_to:
+                with totals.stage("merge"):
+                    append_note = write_appended(args, out_path, merged)
+            else:
+                with totals.stage("serialize"):
+                    write_output(out_path, merged, **out_opts)
+        except ExplanationNumberError as e:
+            print(f"无法写出解析：{e}", file=sys.stderr)
+            return 2
+        if profile:
+            tracemalloc.stop()
+        print(f"✅ 已合并生成：{out_path}（{len(results) - failed} 个文件，共 {total} 题，缓存命中 {hits}，{jobs} 进程，用时 {elapsed:.2f}s{f'；{append_note}' if append_note else ''}）")
+    else:
+        print(f"✅ 已生成 {len(results) - failed} 个文件（共 {total} 题，缓存命中 {hits}，{jobs} 进程，用时 {elapsed:.2f}s）")
+    if profile:
+        report_stats(totals, args, per_file)
+    return 3 if failed else 0
 
 def main():
     ap = argparse.ArgumentParser(
         description="将 Word(.docx) 题库转换为前端使用的 questions_data.js"
     )
-    ap.add_argument("input", help="输入 .docx 文件路径")
-    ap.add_argument("-o", "--output", default="questions_data.js", help="输出 .js 文件路径（默认：questions_data.js）")
+    ap.add_argument("input", help="输入 .docx 文件路径；也可以是目录或通配符（如 \"题库/**/*.docx\"）以批量转换；- 表示从标准输入读取")
+    ap.add_argument("-o", "--output", default="questions_data.js", help="输出 .js 文件路径（默认：questions_data.js）；- 表示写到标准输出；批量模式下为每个输入在其目录生成同名文件")
     ap.add_argument("--start-number", type=int, default=1, help="题号起始值（默认：1）")
     ap.add_argument("--respect-number", action="store_true", help="优先使用 Word 内的题号（默认否）")
+    ap.add_argument("--no-auto-number", action="store_true", help="不解析 Word 自动编号（默认会把自动编号的题号与选项字母拼回段落开头）")
+    ap.add_argument("--answer-key", action="store_true", help="答案集中列在文末（或每章末）的答案表里（如“1-5 CABDA”“1.A 2.B”或表格）时使用：按题号补上答案，并报告未匹配的题号")
+    ap.add_argument("--answer-format", metavar="格式", help="题内没有“答案：”行时，以带该格式的选项为答案：bold=加粗，color=红色字，highlight=突出显示/底纹，any=任一种；可用逗号组合，如 bold,color")
+    ap.add_argument("--explanations", action="store_true", help="识别“解析：”段落，解析不写进题库，另按题号分片写在 -o 旁（<名称>.explain.js 与 <名称>.explain.0000.js 等），主程序.html 提交答案后才加载；-o - 时解析作为 explanation 字段留在每道题里")
+    ap.add_argument("--explain-shard-size", type=int, default=EXPLAIN_SHARD_SIZE, help=f"--explanations 每个解析分片覆盖的题号个数（默认：{EXPLAIN_SHARD_SIZE}）")
+    ap.add_argument("--math", action="store_true", help="把 Word 公式（公式编辑器插入的 OMML）转换为 MathML 写进题目文字，主程序.html 由浏览器直接显示（默认公式会被丢弃）")
+    ap.add_argument("--asset-dir", metavar="目录", help="提取题目里的图片（如接线图），按内容哈希存入该目录（多个题库可共用，相同图片只存一份），题目只记录引用路径；该目录应位于 主程序.html 可访问的位置")
     ap.add_argument("--append-to", help="将结果追加合并到现有 JS（如：./questions_data.js）")
     ap.add_argument("--renumber-after-merge", action="store_true", help="合并后按顺序重新编号（从 --start-number 开始）")
+    ap.add_argument("--dedupe", choices=DEDUPE_POLICIES, help="按归一化内容指纹查重：keep-first=保留最先出现的一份；keep-last=保留最后出现的一份；report=只报告不删除；off=不查重（默认：--append-to / --dedupe-against 时 report，否则 off）")
+    ap.add_argument("--dedupe-against", action="append", metavar="题库.js", help="同时与其他题库查重（可重复指定，如 plc_questions_data.js）；这些题库只读，其中已有的题不再写入输出")
+    ap.add_argument("--near-dupes", metavar="报告.json", help="查找措辞略有不同的近似重复题（MinHash + LSH），把分组与相似度写入 JSON 报告，不修改输出；装了 numpy 时更快")
+    ap.add_argument("--near-threshold", type=float, default=NEAR_THRESHOLD, help=f"--near-dupes 的相似度阈值，0~1（默认：{NEAR_THRESHOLD}）")
+    ap.add_argument("--stream", action="store_true", help="流式读取 docx（不加载 python-docx 对象树，适合超大题库）")
+    ap.add_argument("-j", "--jobs", type=int, default=0, help="批量模式的并行进程数（默认：CPU 核数）")
+    ap.add_argument("--merge", action="store_true", help="批量模式下按文件路径顺序合并为一个题库写入 -o")
+    ap.add_argument("--format", choices=OUTPUT_FORMATS, default="js", help="输出格式：js=对象数组（默认）；columnar=列式紧凑格式，由主程序.html 解码；json-parse=压缩 JSON 包在 JSON.parse('…') 中，浏览器解析更快；ndjson=每行一道题的 JSON，供管道中其他工具处理")
+    ap.add_argument("--from-ndjson", action="store_true", help="输入是 NDJSON（每行一道题，如 --format ndjson 的输出），转换为 -o 指定的格式")
+    ap.add_argument("--var-name", help=f"输出的全局变量名 window.<名称>（默认：--append-to 时沿用现有题库的变量名，否则为 {DEFAULT_VAR_NAME}；PLC 题库为 plcQuestionsData）")
+    ap.add_argument("--precompress", action="store_true", help="为输出文件生成最高压缩率的 .gz/.br 预压缩文件（内容不变时逐字节一致；.br 需 pip install brotli）")
+    ap.add_argument("--shard-size", type=int, default=0, help="分片输出：-o 只写清单，每 N 题一个区间、区间内按题型拆分为分片文件，前端按需加载（默认 0 不分片）")
+    ap.add_argument("--no-cache", action="store_true", help="不使用转换缓存，总是重新解析")
+    ap.add_argument("--cache-dir", help=f"转换缓存目录（默认：{DEFAULT_CACHE_DIR}）")
+    ap.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_MB, help=f"缓存总大小上限，超出按最近最少使用淘汰（默认：{DEFAULT_CACHE_MAX_MB}）")
+    ap.add_argument("--profile", action="store_true", help="打印分阶段耗时、内存峰值与行分类计数到 stderr（此时不使用缓存）")
+    ap.add_argument("--stats-json", help="将分阶段统计写入指定 JSON 文件（可与 --profile 同用）")
 
     args = ap.parse_args()
-    in_path = Path(args.input)
     out_path = Path(args.output)
+    if args.var_name is None:
+        args.var_name = (bank_var_name(Path(args.append_to)) if args.append_to else None) or DEFAULT_VAR_NAME
+    if not RE_JS_IDENT.match(args.var_name):
+        print(f"--var-name 不是合法的 JS 标识符：{args.var_name}", file=sys.stderr)
+        sys.exit(2)
+    if args.answer_format:
+        try:
+            format_mask(args.answer_format)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+    if not 0 < args.near_threshold <= 1:
+        print(f"--near-threshold 应在 0 到 1 之间：{args.near_threshold}", file=sys.stderr)
+        sys.exit(2)
+    if args.explain_shard_size <= 0:
+        print(f"--explain-shard-size 应为正整数：{args.explain_shard_size}", file=sys.stderr)
+        sys.exit(2)
+    if args.shard_size > 0 and args.format == "ndjson":
+        print("--format ndjson 不能与 --shard-size 一起使用", file=sys.stderr)
+        sys.exit(2)
+    if args.precompress and brotli is None:
+        print("⚠️ 未安装 brotli，只生成 .gz（pip install brotli）", file=sys.stderr)
 
+    if args.input == "-" or args.output == "-" or args.from_ndjson:
+        sys.exit(run_pipeline(args))
+
+    inputs = resolve_inputs(args.input)
+    if Path(args.input).is_dir() or glob.has_magic(args.input):
+        if not inputs:
+            print(f"未找到任何 .docx：{args.input}", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(run_batch(inputs, args))
+
+    in_path = inputs[0]
     if not in_path.exists():
         print(f"未找到输入文件：{in_path}", file=sys.stderr)
         sys.exit(2)
 
+    opts = parse_options(args)
+    stats = ConvertStats() if profiling(args) else None
+    if stats is not None:
+        tracemalloc.start()
     try:
-        q_list = parse_docx(in_path, start_number=args.start_number, respect_word_number=args.respect_number)
+        if stats is not None:
+            q_list, note = parse_docx(in_path, stats=stats, **opts), ""
+        else:
+            q_list, note = parse_docx_cached(in_path, opts, cache_from_args(args))
     except Exception as e:
         print(f"解析失败：{e}", file=sys.stderr)
         sys.exit(3)
 
-    if args.append_to:
-        merged = merge_existing(Path(args.append_to), q_list, renumber_after_merge=args.renumber_after_merge, start_number=args.start_number)
-        write_js(out_path, merged)
-    else:
-        write_js(out_path, q_list)
+    append_note = ""
+    if not args.append_to:
+        q_list, append_note = dedupe_new(args, q_list, [out_path])
+        append_note = "，".join(n for n in (append_note, near_dupes_note(args, q_list)) if n)
+    try:
+        if stats is None:
+            if args.append_to:
+                append_note = write_appended(args, out_path, q_list)
+            else:
+                write_output(out_path, q_list, **output_options(args))
+        else:
+            if args.append_to:
+                with stats.stage("merge"):
+                    append_note = write_appended(args, out_path, q_list)
+            else:
+                with stats.stage("serialize"):
+                    write_output(out_path, q_list, **output_options(args))
+            tracemalloc.stop()
+    except ExplanationNumberError as e:
+        print(f"无法写出解析：{e}", file=sys.stderr)
+        sys.exit(2)
+
+    notes = "，".join(n for n in (note, append_note) if n)
+    print(f"✅ 已生成：{out_path}（共 {len(q_list)} 题{f'，{notes}' if notes else ''}）")
+    if stats is not None:
+        report_stats(stats, args)
+
+# ---- 管道模式（标准输入/输出、NDJSON） ----
+def run_pipeline(args) -> int:
+    """
+    input 为 - 时从标准输入读取 docx（--from-ndjson 时读取 NDJSON），-o - 时写到标准输出。
+    题目逐个流过，不经过缓存，也不在内存中保留整个题库（--append-to、查重、--near-dupes 与 columnar 格式除外）。
+    提示信息一律写到 stderr，标准输出只有题库内容。
+    """
+    to_stdout = args.output == "-"
+    if to_stdout and (args.shard_size > 0 or args.precompress):
+        print("-o - 输出到标准输出时不能使用 --shard-size / --precompress", file=sys.stderr)
+        return 2
+    if args.input != "-" and not Path(args.input).is_file():
+        print(f"未找到输入文件：{args.input}", file=sys.stderr)
+        return 2
+
+    count = 0
+    dup_note = ""
+    key_report: Dict[str, List[Any]] = {}
+
+    def counted(items):
+        nonlocal count
+        for q in items:
+            count += 1
+            yield q
+
+    try:
+        if args.from_ndjson:
+            if args.input == "-":
+                source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig")
+            else:
+                source = open(args.input, encoding="utf-8-sig")
+            questions = read_ndjson(source)
+        else:
+            # zip 需要可随机访问的文件，标准输入的 docx 先整体读入内存（docx 本身是压缩过的，体积不大）
+            source = io.BytesIO(sys.stdin.buffer.read()) if args.input == "-" else Path(args.input)
+            questions = iter_questions(source, key_report=key_report, **parse_options(args))
+        questions = counted(questions)
+        policy = dedupe_policy(args)
+        exclude = [] if to_stdout else [Path(args.output)]
+        if args.append_to:
+            recover_append(Path(args.append_to))
+            seen = reference_fingerprints(args, exclude + [Path(args.append_to)]) if policy != "off" else {}
+            questions, _, dups = merge_bank(args, list(questions), policy, seen)
+            dup_note = dedupe_note(dups, policy)
+        elif policy != "off":
+            questions, dup_note = dedupe_new(args, list(questions), exclude)
+        if args.near_dupes:
+            questions = list(questions)
+            dup_note = "，".join(n for n in (dup_note, near_dupes_note(args, questions)) if n)
+        if to_stdout:
+            # NDJSON 每写一行就刷新，下游工具可以立即处理
+            out = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="\n", line_buffering=args.format == "ndjson")
+            try:
+                write_bank(questions, out, format=args.format, var_name=args.var_name)
+                out.flush()
+            finally:
+                out.detach()
+        else:
+            write_output(Path(args.output), questions, **output_options(args, bool(args.append_to) and has_explanations(Path(args.append_to))))
+    except BrokenPipeError:
+        # 下游提前退出（如 | head），不算错误；把标准输出指向 devnull，避免退出时再次报错
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except ExplanationNumberError as e:
+        print(f"无法写出解析：{e}", file=sys.stderr)
+        return 2
+    except Exception as e:
+        print(f"解析失败：{e}", file=sys.stderr)
+        return 3
 
-    print(f"✅ 已生成：{out_path}（共 {len(q_list)} 题）")
+    print(f"✅ 已生成：{'标准输出' if to_stdout else args.output}（共 {count} 题{f'，{dup_note}' if dup_note else ''}）", file=sys.stderr)
+    key_note = key_report_note(key_report)
+    if key_note:
+        print(f"⚠️ {key_note}", file=sys.stderr)
+    return 0
 
 if __name__ == "__main__":
     main()
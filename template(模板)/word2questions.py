@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+word2questions.js.py 的可导入入口（原脚本文件名带 .js，不能直接 import）。
+
+    from word2questions import iter_questions, write_bank
+
+    # 逐题读取上传的 docx，边解析边写出，不把整个题库留在内存里
+    with open("题库.docx", "rb") as f:
+        write_bank(iter_questions(f), "questions_data.js", format="json-parse")
+
+    for q in iter_questions("题库.docx"):
+        save(q.to_dict())  # {"options", "answer", "type", "question", "number"}
+
+    # 写出前先找出措辞略有不同的近似重复题：[[(下标, 相似度), …], …]
+    questions = list(iter_questions("题库.docx"))
+    for group in near_duplicate_clusters(questions, threshold=0.8):
+        print([(questions[i].number, round(score, 2)) for i, score in group])
+
+直接运行本文件等同于运行 word2questions.js.py。
+"""
+import importlib.util
+import sys
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("word2questions_js", Path(__file__).with_name("word2questions.js.py"))
+_impl = importlib.util.module_from_spec(_spec)
+# 先登记到 sys.modules：Question 需要能被 pickle（批量模式的多进程会传递题目）
+sys.modules[_spec.name] = _impl
+_spec.loader.exec_module(_impl)
+
+Question = _impl.Question
+iter_questions = _impl.iter_questions
+write_bank = _impl.write_bank
+parse_docx = _impl.parse_docx
+near_duplicate_clusters = _impl.near_duplicate_clusters
+OUTPUT_FORMATS = _impl.OUTPUT_FORMATS
+DEFAULT_VAR_NAME = _impl.DEFAULT_VAR_NAME
+main = _impl.main
+
+__all__ = ["Question", "iter_questions", "write_bank", "parse_docx", "near_duplicate_clusters", "OUTPUT_FORMATS", "DEFAULT_VAR_NAME", "main"]
+
+if __name__ == "__main__":
+    main()